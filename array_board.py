@@ -0,0 +1,418 @@
+"""Struct-of-arrays board backend that resolves each tick with vectorized numpy operations."""
+
+import copy
+
+import numpy as np
+
+from board import GameBoard, SpellCard
+from events import TURN, ATTACK, KILL, TOWER_DOWN
+from pathing import UNREACHABLE
+
+# target_policy codes
+ALL, GROUND, BUILDINGS = 0, 1, 2
+POLICIES = {'all': ALL, 'ground': GROUND, 'buildings': BUILDINGS}
+
+# Neighbour offsets in the order GameCard.get_legal_actions_and_dists tries them: left, right, down, up
+STEP_X = np.array([-1, 1, 0, 0])
+STEP_Y = np.array([0, 0, -1, 1])
+# Path steps are scaled past any euclidean distance on the board so they compare first
+TIE_SCALE = 64
+
+
+class ArrayUnit:
+    """A live unit on an ArrayBoard, with the GameCard attributes agents and views read.
+
+    Static stats are copied from the card that was placed; everything that changes during a game
+    is read straight out of the board's arrays."""
+    __slots__ = ('board', 'slot', 'handle', 'name', 'cost', 'speed', 'target_policy', 'AoE', 'is_flying',
+                 'is_building', 'is_evil', 'epsilon', 'LegalDeployments')
+
+    def __init__(self, board, slot, card):
+        self.board = board
+        self.slot = slot
+        self.handle = None
+        self.name = card.name
+        self.cost = card.cost
+        self.speed = card.speed
+        self.target_policy = card.target_policy
+        self.AoE = card.AoE
+        self.is_flying = card.is_flying
+        self.is_building = card.is_building
+        self.is_evil = card.is_evil
+        self.epsilon = card.epsilon
+        self.LegalDeployments = card.LegalDeployments
+
+    def copy(self, board):
+        """This unit's proxy on board, a clone of its own board."""
+        unit = object.__new__(ArrayUnit)
+        for slot in ArrayUnit.__slots__:
+            setattr(unit, slot, getattr(self, slot))
+        unit.board = board
+        return unit
+
+    @property
+    def location(self):
+        return (int(self.board.x[self.slot]), int(self.board.y[self.slot]))
+
+    @property
+    def health(self):
+        return int(self.board.health[self.slot])
+
+    @property
+    def maxhealth(self):
+        return int(self.board.maxhealth[self.slot])
+
+    @property
+    def units(self):
+        return int(self.board.units[self.slot])
+
+    @property
+    def dps(self):
+        return int(self.board.dps[self.slot])
+
+    @property
+    def range(self):
+        return float(self.board.range[self.slot])
+
+    @property
+    def status(self):
+        return bool(self.board.status[self.slot])
+
+    @property
+    def target(self):
+        """The unit being targeted, or None once it has left the board."""
+        target = self.board.target_slot[self.slot]
+        if target < 0 or not self.board.alive[target]:
+            return None
+        return self.board.units_by_slot[target]
+
+    def target_distance(self, x = None, y = None):
+        """Returns euclidean distance from (x,y) to self.target."""
+        if x is None and y is None:
+            x,y = self.location
+        target = self.target
+        if not target:
+            return 0
+        return ((x - target.location[0]) ** 2 + (y - target.location[1])**2) ** 0.5
+
+
+class ArrayBoard(GameBoard):
+    """A GameBoard that keeps every unit in parallel numpy arrays indexed by slot.
+
+    Slots are handed out in placement order and never reused within a game, so a slot's index
+    doubles as the order GameBoard breaks targeting ties with, and a target slot whose unit has been
+    swept is simply one that is no longer alive. Units are also registered in the board's
+    TroopRegistry, so live_troops and live_evil_troops behave as they do on a GameBoard.
+
+    It plays a different ruleset from GameBoard, not the same game faster: update_state resolves
+    all units at once from the state at the start of the tick, so no unit sees moves or damage made
+    earlier in the tick (contested tiles go to the unit placed first), and exploration draws from its
+    own numpy generator. Games from the same seed therefore end differently than on a GameBoard.
+    Damage, unit loss, stun, scoring and legality follow the object path, each hit landing
+    separately in placement order of the units dealing them."""
+    def __init__(self, deck=None, log=None, seed=None, capacity=64):
+        self.capacity = 0
+        self.count = 0
+        self.units_by_slot = []
+        self.names = []
+        self.allocate(capacity)
+        super().__init__(deck, log, seed)
+        # Vectorized moves draw from their own generator, seeded like the board's
+        self.np_rng = np.random.default_rng(self.seed)
+
+    def clone(self, log=None, seed=None):
+        """An independent copy of the game in progress; see GameBoard.clone. Every array is copied."""
+        board = super().clone(log, seed)
+        board.np_rng = copy.deepcopy(self.np_rng) if seed is None else np.random.default_rng(seed)
+        # Swept units are not in the registry but their slots can still be looked up
+        board.units_by_slot = [board.registry.get(unit.handle) or unit.copy(board) for unit in self.units_by_slot]
+        board.names = list(self.names)
+        return board
+
+    def restore(self, snapshot):
+        super().restore(snapshot)
+        for unit in self.units_by_slot:
+            unit.board = self
+
+    def allocate(self, capacity):
+        """Grow every per-unit array to hold capacity units."""
+        def grow(array, dtype, fill=0):
+            new = np.full(capacity, fill, dtype=dtype)
+            if array is not None:
+                new[:self.count] = array[:self.count]
+            return new
+
+        first = self.capacity == 0
+        self.health = grow(None if first else self.health, np.int64)
+        self.maxhealth = grow(None if first else self.maxhealth, np.int64)
+        self.units = grow(None if first else self.units, np.int64)
+        self.dps = grow(None if first else self.dps, np.int64)
+        self.range = grow(None if first else self.range, np.float64)
+        self.epsilon = grow(None if first else self.epsilon, np.float64)
+        self.x = grow(None if first else self.x, np.int64)
+        self.y = grow(None if first else self.y, np.int64)
+        self.target_slot = grow(None if first else self.target_slot, np.int64, -1)
+        self.policy = grow(None if first else self.policy, np.int8)
+        self.flying = grow(None if first else self.flying, bool)
+        self.building = grow(None if first else self.building, bool)
+        self.spell = grow(None if first else self.spell, bool)
+        self.status = grow(None if first else self.status, bool)
+        self.evil = grow(None if first else self.evil, bool)
+        self.alive = grow(None if first else self.alive, bool)
+        self.dying = grow(None if first else self.dying, bool)
+        self.capacity = capacity
+
+    def add_troop(self, card):
+        """Copy a placed card into the next free slot and list it as a live unit of its team."""
+        if self.count == self.capacity:
+            self.allocate(2 * self.capacity)
+        slot = self.count
+        self.count += 1
+        self.health[slot] = card.health
+        self.maxhealth[slot] = card.maxhealth
+        self.units[slot] = card.units
+        self.dps[slot] = card.dps
+        self.range[slot] = card.range
+        self.epsilon[slot] = card.epsilon
+        self.x[slot], self.y[slot] = card.location
+        self.target_slot[slot] = -1
+        self.policy[slot] = POLICIES.get(card.target_policy, ALL)
+        self.flying[slot] = card.is_flying
+        self.building[slot] = card.is_building
+        self.spell[slot] = isinstance(card, SpellCard)
+        self.status[slot] = False
+        self.evil[slot] = card.is_evil
+        self.alive[slot] = True
+        self.dying[slot] = False
+
+        unit = ArrayUnit(self, slot, card)
+        self.units_by_slot.append(unit)
+        self.names.append(card.name)
+        self.registry.add(unit)
+        self.occupy(card.location)
+        return unit
+
+    def relocate(self, card, location):
+        """Move a live unit to location, keeping the occupancy grid in sync."""
+        self.vacate(card.location)
+        self.x[card.slot], self.y[card.slot] = location
+        self.occupy(location)
+
+    def target(self, card, target_policy):
+        """Allows a card to target the nearest enemy card given its policy."""
+        slot = self.nearest(np.array([card.slot]))[0]
+        if slot < 0:
+            return None
+        return self.units_by_slot[slot]
+
+    def nearest(self, seekers):
+        """Slot of the nearest valid enemy for each seeker slot, or -1; ties go to the lowest slot."""
+        candidates = np.flatnonzero(self.alive[:self.count])
+        if not len(seekers) or not len(candidates):
+            return np.full(len(seekers), -1)
+        dx = self.x[seekers][:, None] - self.x[candidates][None, :]
+        dy = self.y[seekers][:, None] - self.y[candidates][None, :]
+        dist = dx * dx + dy * dy
+
+        policy = self.policy[seekers][:, None]
+        valid = self.evil[seekers][:, None] != self.evil[candidates][None, :]
+        valid &= ((policy == ALL)
+                  | ((policy == GROUND) & ~self.flying[candidates][None, :])
+                  | ((policy == BUILDINGS) & self.building[candidates][None, :]))
+        dist = np.where(valid, dist, np.iinfo(np.int64).max)
+        best = candidates[np.argmin(dist, axis=1)]
+        return np.where(valid.any(axis=1), best, -1)
+
+    def sweep_dead(self):
+        """Remove units that died last tick and score any towers among them."""
+        swept = np.flatnonzero(self.alive[:self.count] & self.dying[:self.count])
+        if not len(swept):
+            return
+        for slot in swept:
+            unit = self.units_by_slot[slot]
+            self.alive[slot] = False
+            self.registry.remove(unit)
+            self.vacate(unit.location)
+            if unit.is_building and self.log.info:
+                self.log.emit(TOWER_DOWN, self.turn, None, unit.name, 0, unit.is_evil)
+            if unit.is_evil:
+                if unit.name == 'princess tower':
+                    self.score += 1
+                    self.troop_damage += 100
+                elif unit.name == 'king tower':
+                    self.score = 3
+                    self.troop_damage += 1000
+            else:
+                if unit.name == 'princess tower':
+                    self.evil_score += 1
+                    self.evil_troop_damage += 100
+                elif unit.name == 'king tower':
+                    self.evil_score = 3
+                    self.evil_troop_damage += 1000
+
+    def update_state(self, dt = None):
+        """Update loop for entire game: resolve every unit's turn at once, clear trash, assess game condition."""
+        if self.log.debug:
+            self.log.emit(TURN, self.turn)
+        if self.assess_game_over():
+            return
+        self.sweep_dead()
+
+        # Update global time
+        self.time -= 1
+        self.troop_damage = 0
+        self.evil_troop_damage = 0
+
+        acting = np.flatnonzero(self.alive[:self.count])
+        # (sources, targets, amounts) arrays of this tick's hits
+        damage = []
+
+        spells = acting[self.spell[acting]]
+        troops = acting[~self.spell[acting]]
+        if len(spells):
+            self.cast_spells(spells, damage)
+
+        # If affected by status (zap), take a turn off and retarget..
+        stunned = troops[self.status[troops]]
+        ready = troops[~self.status[troops]]
+        self.status[stunned] = False
+
+        target = self.target_slot[ready]
+        has_target = (target >= 0) & self.alive[target]
+        dist = np.hypot(self.x[ready] - self.x[target], self.y[ready] - self.y[target])
+        in_range = has_target & (dist < self.range[ready] + 1)
+        self.attack(ready[in_range], damage)
+
+        seeking = np.concatenate([stunned, ready[~in_range]])
+        self.target_slot[seeking] = self.nearest(seeking)
+        movers = ready[~in_range]
+        movers = movers[(self.target_slot[movers] >= 0) & ~self.building[movers]]
+        self.move(movers)
+
+        self.apply_damage(damage)
+
+    def attack(self, attackers, damage):
+        """Every attacker hits its target once; kills clear the attacker's target."""
+        if not len(attackers):
+            return
+        targets = self.target_slot[attackers]
+        hits = self.dps[attackers] * self.units[attackers]
+        will_die = ((self.units[targets] - 1) * self.maxhealth[targets] + self.health[targets]) < hits
+        if self.log.info:
+            self.log_hits(attackers, targets, hits, will_die)
+        self.target_slot[attackers[will_die]] = -1
+        damage.append((attackers, targets, hits))
+        evil = self.evil[attackers]
+        self.troop_damage += int(hits[~evil].sum())
+        self.evil_troop_damage += int(hits[evil].sum())
+
+    def cast_spells(self, spells, damage):
+        """Spells hit and stun every enemy in range, then die."""
+        candidates = np.flatnonzero(self.alive[:self.count])
+        dx = self.x[spells][:, None] - self.x[candidates][None, :]
+        dy = self.y[spells][:, None] - self.y[candidates][None, :]
+        dist = np.hypot(dx, dy)
+        # SpellCard.target_distance treats a target at (0, 0) as distance 0
+        at_origin = (self.x[candidates] == 0) & (self.y[candidates] == 0)
+        dist = np.where(at_origin[None, :], 0, dist)
+        hit = (dist < self.range[spells][:, None]) & (self.evil[spells][:, None] != self.evil[candidates][None, :])
+
+        hits = self.dps[spells] * self.units[spells]
+        spell_rows, target_cols = np.nonzero(hit)
+        targets = candidates[target_cols]
+        spell_hits = hits[spell_rows]
+        if self.log.info:
+            will_die = ((self.units[targets] - 1) * self.maxhealth[targets] + self.health[targets]) < spell_hits
+            self.log_hits(spells[spell_rows], targets, spell_hits, will_die)
+        damage.append((spells[spell_rows], targets, spell_hits))
+        self.status[candidates[hit.any(axis=0)]] = True
+        evil = self.evil[spells]
+        per_spell = hits * hit.sum(axis=1)
+        self.troop_damage += int(per_spell[~evil].sum())
+        self.evil_troop_damage += int(per_spell[evil].sum())
+        self.dying[spells] = True
+
+    def log_hits(self, attackers, targets, hits, will_die):
+        """Emit attack and kill events for a batch of hits; only called when the log is on."""
+        for attacker, target, amount, kills in zip(attackers, targets, hits, will_die):
+            source = self.names[attacker]
+            evil = bool(self.evil[attacker])
+            if self.log.debug:
+                self.log.emit(ATTACK, self.turn, source, self.names[target], int(amount), evil)
+            if kills:
+                self.log.emit(KILL, self.turn, source, self.names[target], 0, evil)
+
+    def move(self, movers):
+        """Step every mover to its best free neighbour, or a random one w.p. its epsilon."""
+        if not len(movers):
+            return
+        x = self.x[movers][:, None] + STEP_X[None, :]
+        y = self.y[movers][:, None] + STEP_Y[None, :]
+        inside = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+        free = inside & (self.board[np.clip(y, 0, self.height - 1), np.clip(x, 0, self.width - 1)] == 0)
+        can_move = free.any(axis=1)
+
+        targets = self.target_slot[movers]
+        dist = np.hypot(x - self.x[targets][:, None], y - self.y[targets][:, None])
+        # Flow field steps to each target, with euclidean distance breaking ties as in GameCard.move
+        steps = np.full(x.shape, UNREACHABLE, dtype=np.float32)
+        clip_x, clip_y = np.clip(x, 0, self.width - 1), np.clip(y, 0, self.height - 1)
+        for target in np.unique(targets):
+            tx, ty = int(self.x[target]), int(self.y[target])
+            if self.in_bounds(tx, ty):
+                rows = targets == target
+                steps[rows] = self.paths.field((tx, ty))[clip_y[rows], clip_x[rows]]
+        dist = np.where(steps != UNREACHABLE, steps * TIE_SCALE + dist, dist)
+        choice = np.argmin(np.where(free, dist, np.inf), axis=1)
+
+        explore = self.np_rng.random(len(movers)) <= self.epsilon[movers]
+        pick = (self.np_rng.random(len(movers)) * free.sum(axis=1)).astype(np.int64)
+        random_choice = np.argmax(np.cumsum(free, axis=1) > pick[:, None], axis=1)
+        choice = np.where(explore, random_choice, choice)
+
+        movers = movers[can_move]
+        rows = np.arange(len(choice))[can_move]
+        new_x = x[rows, choice[can_move]]
+        new_y = y[rows, choice[can_move]]
+        # Contested tiles go to the unit placed first
+        _, first = np.unique(new_y * self.width + new_x, return_index=True)
+        movers, new_x, new_y = movers[first], new_x[first], new_y[first]
+
+        old_x, old_y = self.x[movers], self.y[movers]
+        was_inside = (old_x >= 0) & (old_x < self.width) & (old_y >= 0) & (old_y < self.height)
+        np.subtract.at(self.board, (old_y[was_inside], old_x[was_inside]), 1)
+        np.add.at(self.board, (new_y, new_x), 1)
+        self.x[movers] = new_x
+        self.y[movers] = new_y
+
+    def apply_damage(self, damage):
+        """Apply this tick's hits, a list of (sources, targets, amounts) arrays, as GameCard.take_damage would.
+
+        A unit's hits land one at a time in the order their sources were placed, each losing at most
+        one unit; units hit several times are stepped together, one round per hit."""
+        if not damage:
+            return
+        sources, targets, amounts = (np.concatenate(column) for column in zip(*damage))
+        if not len(targets):
+            return
+        order = np.lexsort((sources, targets))
+        targets, amounts = targets[order], amounts[order]
+        # Position of each hit among those on its target
+        first = np.flatnonzero(np.r_[True, targets[1:] != targets[:-1]])
+        counts = np.diff(np.r_[first, len(targets)])
+        rank = np.arange(len(targets)) - np.repeat(first, counts)
+        for hit_round in range(counts.max()):
+            this_round = rank == hit_round
+            hit, dealt = targets[this_round], amounts[this_round]
+            # take_damage on a unit already dead does nothing that outlives the sweep
+            live = self.units[hit] > 0
+            hit, dealt = hit[live], dealt[live]
+            health = self.health[hit]
+            overkill = dealt > health
+            self.health[hit[~overkill]] -= dealt[~overkill]
+
+            lost = hit[overkill]
+            self.units[lost] -= 1
+            survivors = self.units[lost] > 0
+            self.health[lost[survivors]] = self.maxhealth[lost[survivors]] - (dealt[overkill][survivors] - health[overkill][survivors])
+            self.dying[lost[~survivors]] = True
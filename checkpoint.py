@@ -0,0 +1,95 @@
+"""Background checkpointing of a learning agent's Q-values as a base snapshot plus deltas."""
+
+import os
+import queue
+import threading
+
+from qtable import CHECKPOINT_SUFFIX, checkpoint_meta, delta_numbers, open_checkpoint, save_checkpoint, save_delta
+
+
+def checkpoint_name(filename):
+    """The checkpoint file to keep beside a Q-value file of any format."""
+    if filename.endswith(CHECKPOINT_SUFFIX):
+        return filename
+    return os.path.splitext(filename)[0] + CHECKPOINT_SUFFIX
+
+
+class Checkpointer:
+    """Saves an agent's changed Q-values every `every` episodes on a writer thread.
+
+    Each checkpoint takes only the entries set since the last one off the agent's table and hands
+    them to the thread, which writes them as a delta, so the training thread never waits on disk.
+    Every compact_every deltas the thread folds them into the base snapshot. Loading the file with
+    agent.load (or open_checkpoint) replays base + deltas. Create it after loading the agent's
+    Q-values: if the checkpoint already exists, e.g. left by a run that crashed, the agent resumes
+    from it instead, since it holds everything learned since those were saved."""
+    def __init__(self, agent, filename, every=10, compact_every=10):
+        self.agent = agent
+        self.filename = filename
+        self.every = every
+        self.compact_every = compact_every
+        self.space_key = agent.space_key()
+        self.episodes = 0
+        self.error = None
+        self.uncompacted = 0
+
+        meta = checkpoint_meta(filename)
+        numbers = delta_numbers(filename)
+        if meta is not None or numbers:
+            print("Resuming from checkpoint", filename, "(remove its files to start from the loaded Q-values)")
+            agent.load_checkpoint(filename)
+        # Deltas apply to the agent's table as it is now, so that starts as the base, superseding
+        # the deltas it already includes
+        self.number = max(numbers[-1] if numbers else 0, meta.get('through', 0) if meta else 0)
+        save_checkpoint(agent.qvalues, filename, self.space_key, through=self.number)
+        agent.qvalues.track_changes()
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="checkpointer", daemon=True)
+        self.thread.start()
+
+    def episode_done(self):
+        """Call after each episode; checkpoints every `every` of them."""
+        self.episodes += 1
+        if self.episodes % self.every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Queue a delta of everything set since the last checkpoint."""
+        if self.error is not None:
+            raise self.error
+        states, actions, values = self.agent.qvalues.take_changes()
+        if len(states):
+            self.number += 1
+            self.jobs.put((self.number, states, actions, values))
+
+    def close(self):
+        """Checkpoint what is left, wait for the thread to write everything, and compact."""
+        self.checkpoint()
+        self.jobs.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    if self.uncompacted:
+                        self.compact()
+                    return
+                number, states, actions, values = job
+                save_delta(self.filename, number, states, actions, values)
+                self.uncompacted += 1
+                if self.uncompacted >= self.compact_every:
+                    self.compact()
+            except Exception as error:
+                self.error = error
+                return
+
+    def compact(self):
+        """Fold every delta written so far into the base snapshot."""
+        table = open_checkpoint(self.filename, self.space_key, writable=True)
+        numbers = delta_numbers(self.filename)
+        save_checkpoint(table, self.filename, self.space_key, through=numbers[-1])
+        self.uncompacted = 0
@@ -2,12 +2,37 @@
 from typing import List
 
 from board import *
+from spaces import MAX_DISTANCE, MAX_ELIXIR, agent_space
+from qtable import CHECKPOINT_SUFFIX, DenseQTable, SparseQTable, open_checkpoint, save_checkpoint
+from simulation import process_action
 #from game import *
+import math
 import random
+import time
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import hashlib
 from ast import literal_eval as make_tuple
 from tqdm import tqdm
 
+# Q-value files hold one row per non-zero value, state (card, distance, elixir) and action (card, x, y)
+# as columns, with None cards as nulls. The version lives in the schema metadata; files without it
+# are the old format of str((state, action)) keys in one S_and_A column.
+QVALS_VERSION = 2
+QVALS_METADATA_KEY = b'royal_ghost_qvals'
+QVALS_SCHEMA = pa.schema([('card', pa.dictionary(pa.int8(), pa.string())),
+                          ('distance', pa.int8()),
+                          ('elixir', pa.int8()),
+                          ('action_card', pa.dictionary(pa.int8(), pa.string())),
+                          ('action_x', pa.int8()),
+                          ('action_y', pa.int8()),
+                          ('value', pa.float32())],
+                         metadata={QVALS_METADATA_KEY: str(QVALS_VERSION).encode()})
+QVALS_ROW_GROUP = 65536
+# TileCodedAgent weight files hold (feature, value) rows, tagged with the agent's space_key
+WEIGHTS_METADATA_KEY = b'royal_ghost_weights'
+
 class RandomLegalAgent:
     """A reinforcement learning agent who only ever plays a random, legal card
     or None every step."""
@@ -16,35 +41,11 @@ class RandomLegalAgent:
         self.board = board
         self.deck = deck
         self.is_evil = False
-        self.actions = []
-        # actions as for all cards (and None), possible locations (card, (x,y))
-        for card in deck:
-            for location in card.LegalDeployments:
-                self.actions.append((card.name, location))
-
-        all_locations = []
-        for i in range(self.board.width):
-            for j in range(self.board.height):
-                all_locations.append((i, j))
-        self.actions.extend([(None, loc) for loc in all_locations])
-
-
-        states = []
-        # states for all nearest possible troops (card, (location))
-        for card in enemydeck:
-            states.extend([(card.name, loc) for loc in all_locations])
-
-        all_states = []
-        # all states as (card, (location), elixir)
-        for state in states:
-            all_states.extend([(state[0], state[1], elixir) for elixir in range(11)])
+        self.space = agent_space(deck, enemydeck, board)
+        self.actions = self.space.actions
 
-        self.states = all_states
-
-        self.qvalues = {}
-        #print(self.states)
-        for state in self.states:
-            self.qvalues[state] = 0.0
+        # It never learns, so nothing is ever stored
+        self.qvalues = SparseQTable(len(self.space.states), len(self.actions))
 
     def getAction(self, state):
         legal_actions = self.board.get_legal_actions(self.is_evil)
@@ -63,57 +64,133 @@ class RandomLegalAgent:
         return
 
 
-class NearestTroopAgent:
-    """A Reinfocement Learning Agent to consider
-    only the nearest troop."""
+class QAgent:
+    """What the learning agents share: their spaces.AgentSpace, legal actions, epsilon-greedy play,
+    and saving and loading self.qvalues as a .npy checkpoint or parquet file.
+
+    Subclasses hold a qtable table in self.qvalues and define computeActionFromQValues, space_key,
+    export_agent and load_qvals."""
 
     def __init__(self, deck : List[GameCard], enemydeck : List[GameCard], board : GameBoard, epsilon = 0.2, discount = 0.9, learning_rate = 0.2):
         self.board = board
         self.deck = deck
         self.is_evil = False
-        self.actions = []
-        # actions as for all cards (and None), possible locations (card, (x,y))
+        # Built once per deck and board layout, and shared with every other agent on them
+        self.space = agent_space(deck, enemydeck, board)
+        self.actions = self.space.actions
+        self.action_indices = self.space.action_indices
+
+        # Exploration probability
+        self.epsilon = epsilon
+        self.discount = discount
+        self.alpha = learning_rate
+
+    def legal_key(self):
+        """What the legal actions on self.board depend on: (sorted hand names, elixir, side)."""
+        if self.is_evil:
+            hand, elixir = self.board.evil_hand, self.board.evil_elixir_count
+        else:
+            hand, elixir = self.board.hand, self.board.elixir_count
+        return tuple(sorted(card.name for card in hand)), elixir, self.is_evil
+
+    def legal_actions(self):
+        """(mask, indices) of the legal actions on self.board right now; see AgentSpace.legal_actions."""
+        return self.space.legal_actions(self.legal_key())
+
+    def legal_action_mask(self):
+        return self.legal_actions()[0]
+
+    def legal_action_indices(self):
+        return self.legal_actions()[1]
+
+    def getAction(self, state):
+        """
+          Compute the action to take in the current state.  With
+          probability self.epsilon, we should take a random action and
+          take the best policy action otherwise.
+        """
+        # Pick Action
+        explore = random.random() <= self.epsilon
+        if explore:
+            legal = self.legal_action_indices()
+            return self.actions[legal[random.randrange(len(legal))]]
+        else:
+            return self.computeActionFromQValues(state)
 
-        for card in deck:
-            for location in card.LegalDeployments:
-                self.actions.append((card.name, location))
+    def save_checkpoint(self, filename):
+        save_checkpoint(self.qvalues, filename, self.space_key())
+        print("Wrote checkpoint", filename)
 
-        all_locations = []
-        for i in range(self.board.width):
-            for j in range(self.board.height):
-                all_locations.append((i, j))
-        self.actions.append((None, (0,0)))
+    def load_checkpoint(self, filename, frozen=False):
+        """Take Q-values from a checkpoint. A frozen agent, e.g. the adversary, which never updates,
+        shares the memory-mapped file read-only instead of holding its own copy."""
+        table = open_checkpoint(filename, self.space_key(), writable=not frozen)
+        if frozen or isinstance(self.qvalues, DenseQTable):
+            self.qvalues = table
+        else:
+            self.qvalues = SparseQTable(*table.shape)
+            states, actions = np.nonzero(table.table)
+            self.qvalues.set_many(states, actions, table.table[states, actions])
+
+    def load(self, filename, frozen=False):
+        """load_checkpoint for checkpoint files, load_qvals for parquet."""
+        if filename.endswith(CHECKPOINT_SUFFIX):
+            self.load_checkpoint(filename, frozen)
+        else:
+            if frozen:
+                print(filename, "is not a .npy checkpoint, so the frozen agent keeps its own copy;",
+                      "save the Q-values to one to share it read-only")
+            self.load_qvals(filename)
+
+    def save(self, filename):
+        """save_checkpoint for checkpoint files, export_agent for parquet."""
+        if filename.endswith(CHECKPOINT_SUFFIX):
+            self.save_checkpoint(filename)
+        else:
+            self.export_agent(filename)
 
-        states = []
-        # states for all nearest possible troops (card, (location))
-        for card in enemydeck:
-            states.extend([(card.name, i) for i in range(36)])
 
-        # Initializing for extraneous states.
-        states.extend([('princess tower', i) for i in range(36)])
-        states.extend([('king tower', i) for i in range(36)])
-        states.append((None, 0))
+class NearestTroopAgent(QAgent):
+    """A Reinfocement Learning Agent to consider
+    only the nearest troop.
 
-        all_states = []
-        # all states as (card, (location), elixir)
-        for state in states:
-            all_states.extend([(state[0], state[1], elixir) for elixir in range(11)])
+    Q-values live in self.qvalues, a qtable.DenseQTable (or SparseQTable if sparse, which only stores
+    what has been visited) with one row per state and one column per action of self.space, the
+    spaces.AgentSpace shared by every agent on the same decks; encode_state and encode_action map
+    (name, dist, elixir) states and (card, (x, y)) actions to those indices.
 
-        self.states = all_states
+    With replay, an experience.ReplayBuffer, update stores each transition there instead of learning
+    from it on the spot, and every update_every transitions learns from a sampled batch_size of them
+    (never, if update_every is 0, as for an actor whose transitions are learned from elsewhere)."""
 
-        qstates = []
-        for state in all_states:
-            qstates.extend([(state, action) for action in self.actions])
+    def __init__(self, deck : List[GameCard], enemydeck : List[GameCard], board : GameBoard, epsilon = 0.2, discount = 0.9, learning_rate = 0.2,
+                 sparse = False, replay = None, batch_size = 32, update_every = 4):
+        super().__init__(deck, enemydeck, board, epsilon, discount, learning_rate)
+        self.action_ranges = self.space.action_ranges
+        self.states = self.space.states
+        self.state_indices = self.space.state_indices
 
-        self.qvalues = {}
-        for state in qstates:
-            self.qvalues[state] = 0.0
+        table = SparseQTable if sparse else DenseQTable
+        self.qvalues = table(len(self.states), len(self.actions))
 
-        # Exploration probability
-        self.epsilon = epsilon
-        self.discount = discount
-        self.alpha = learning_rate
-        #print(list(self.qvalues.keys())[:10])
+        self.replay = replay
+        self.batch_size = batch_size
+        self.update_every = update_every
+        self.transitions = 0
+
+    def encode_state(self, state):
+        """Row of state in self.qvalues, or None if it is not in the state space."""
+        return self.state_indices.get(state)
+
+    def decode_state(self, index):
+        return self.states[index]
+
+    def encode_action(self, action):
+        """Column of action in self.qvalues, or None if it is not in the action space."""
+        return self.action_indices.get(action)
+
+    def decode_action(self, index):
+        return self.actions[index]
 
     def getQValue(self, state, action):
         """
@@ -121,11 +198,11 @@ class NearestTroopAgent:
           Should return 0.0 if we have never seen a state
           or the Q node value otherwise
         """
-        s_a_pair = tuple((state, action))
-        if s_a_pair in self.qvalues:
-            return self.qvalues[s_a_pair]
-        else:
+        row = self.encode_state(state)
+        column = self.encode_action(action)
+        if row is None or column is None:
             return 0.0
+        return self.qvalues.get(row, column)
 
     def computeValueFromQValues(self, state):
         """
@@ -134,37 +211,21 @@ class NearestTroopAgent:
           there are no legal actions, which is the case at the
           terminal state, you should return a value of 0.0.
         """
-        actions = self.board.get_legal_actions(self.is_evil)
-        if not actions:
+        row = self.encode_state(state)
+        if row is None:
             return 0.0
-        else:
-            return max([self.getQValue(state, action) for action in actions])
+        return float(self.qvalues.values(row, self.legal_action_indices()).max())
 
     def computeActionFromQValues(self, state):
         """
           Compute the best action to take in a state.
         """
-        actions = self.board.get_legal_actions(self.is_evil)
-        if not actions:
-            return None
-        else:
-            actions_and_vals = [(action, self.getQValue(state, action)) for action in actions]
-            # Find max tuple by Qvalue and return corresponding action
-            return max(actions_and_vals, key=lambda x: x[1])[0]
-
-    def getAction(self, state):
-        """
-          Compute the action to take in the current state.  With
-          probability self.epsilon, we should take a random action and
-          take the best policy action otherwise.
-        """
-        # Pick Action
-        legalActions = self.board.get_legal_actions(self.is_evil)
-        explore = random.random() <= self.epsilon
-        if explore:
-            return random.choice(legalActions)
-        else:
-            return self.computeActionFromQValues(state)
+        legal = self.legal_action_indices()
+        row = self.encode_state(state)
+        if row is None:
+            return self.actions[legal[0]]
+        # argmax keeps the first of equal values, so with nothing learned yet None is played
+        return self.actions[legal[np.argmax(self.qvalues.values(row, legal))]]
 
     def update(self, state, action, nextState, reward: float):
         """
@@ -174,27 +235,374 @@ class NearestTroopAgent:
           NOTE: You should never call this function,
           it will be called on your behalf
         """
+        if self.replay is not None:
+            self.remember(state, action, nextState, reward)
+            return
+        row = self.state_indices[state]
+        column = self.action_indices[action]
         curr_sample = reward + self.discount * self.computeValueFromQValues(nextState)
-        self.qvalues[(state, action)] = (1 - self.alpha) * self.qvalues[(state, action)] + self.alpha * curr_sample
+        self.qvalues.set(row, column, (1 - self.alpha) * self.qvalues.get(row, column) + self.alpha * curr_sample)
+
+    def remember(self, state, action, nextState, reward):
+        """Store a transition in self.replay, with the legal actions on self.board (at nextState), and
+        learn from a batch every update_every transitions."""
+        next_row = self.encode_state(nextState)
+        self.replay.add(self.state_indices[state], self.action_indices[action], reward,
+                        -1 if next_row is None else next_row, self.space.legal_id(self.legal_key()))
+        self.transitions += 1
+        if self.update_every and self.transitions % self.update_every == 0 and len(self.replay) >= self.batch_size:
+            self.learn_batch()
+
+    def learn_batch(self):
+        """One vectorized Q-learning update over a batch sampled from self.replay.
+
+        Each sampled Q(s, a) moves alpha of the way to r + discount * max Q(s', a') over the actions
+        legal at s', scaled by the sample's importance weight; a transition drawn twice counts once."""
+        replay = self.replay
+        slots, weights = replay.sample(self.batch_size)
+        states, actions = replay.states[slots], replay.actions[slots]
+        next_states = replay.next_states[slots]
+        known = next_states >= 0
+        next_values = np.zeros(len(slots), dtype=np.float32)
+        if known.any():
+            legal = self.space.legal_masks()[replay.next_legal[slots[known]]]
+            next_values[known] = np.where(legal, self.qvalues.state_rows(next_states[known]), -np.inf).max(axis=1)
+        current = self.qvalues.get_many(states, actions)
+        errors = replay.rewards[slots] + self.discount * next_values - current
+        self.qvalues.set_many(states, actions, current + self.alpha * weights * errors)
+        replay.update_priorities(slots, errors)
+
+    def qvals_columns(self):
+        return self.space.qvals_columns()
+
+    def coverage(self):
+        """How much of the Q-table has been explored (is non-zero), from the table's running counts.
+
+        Returns (explored, size, by_card, by_elixir), where by_card and by_elixir map the state's
+        nearest card (None for no troop) and elixir to (explored, size) over their states' rows."""
+        columns = self.qvals_columns()
+        explored = self.qvalues.nonzero_by_state()
+        n_actions = len(self.actions)
+
+        def breakdown(keys, labels):
+            found = np.bincount(keys, weights=explored, minlength=len(labels))
+            rows = np.bincount(keys, minlength=len(labels))
+            return {label: (int(found[key]), int(rows[key]) * n_actions)
+                    for key, label in enumerate(labels) if rows[key]}
+
+        by_card = breakdown(columns['state_card'] + 1, [None] + columns['card_names'])
+        by_elixir = breakdown(columns['elixir'], list(range(columns['elixir'].max() + 1)))
+        return self.qvalues.count_nonzero(), self.qvalues.size, by_card, by_elixir
+
+    def export_agent(self, filename, row_group_size=QVALS_ROW_GROUP):
+        """Write every non-zero Q-value to a parquet file, streamed out one row group at a time."""
+        columns = self.qvals_columns()
+        dictionary = pa.array(columns['card_names'], type=pa.string())
+
+        def cards(codes):
+            return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0, type=pa.int8()), dictionary)
+
+        total = 0
+        with pq.ParquetWriter(filename, QVALS_SCHEMA) as writer:
+            for rows, cols, values in self.qvalues.chunks(row_group_size):
+                writer.write_table(pa.Table.from_arrays([
+                    cards(columns['state_card'][rows]),
+                    pa.array(columns['distance'][rows]),
+                    pa.array(columns['elixir'][rows]),
+                    cards(columns['action_card'][cols]),
+                    pa.array(columns['action_x'][cols]),
+                    pa.array(columns['action_y'][cols]),
+                    pa.array(values.astype(np.float32))], schema=QVALS_SCHEMA))
+                total += len(rows)
+        print("Wrote", total, "values to", filename)
+
+    def load_qvals(self, filename):
+        """Set Q-values from a file written by export_agent, or by its older S_and_A format."""
+        table = pq.read_table(filename)
+        if 'S_and_A' in table.column_names:
+            self.load_legacy_qvals(table.to_pandas())
+            return
+        version = (table.schema.metadata or {}).get(QVALS_METADATA_KEY)
+        if version != str(QVALS_VERSION).encode():
+            raise ValueError(filename + " is not a version " + str(QVALS_VERSION) + " Q-value file")
+        print("Reading", table.num_rows, "q values from file.")
+
+        columns = self.qvals_columns()
+
+        def cards(name):
+            categorical = pd.Categorical(table.column(name).to_pandas())
+            # The file's own dictionary codes, translated to this agent's; -2 for cards it doesn't know
+            lookup = np.array([columns['card_codes'].get(card, -2) for card in categorical.categories] + [-1])
+            return lookup[np.asarray(categorical.codes)]
+
+        def lookup(grid, card, a, b):
+            card, a, b = card + 1, a.astype(np.int64), b.astype(np.int64)
+            inside = (card >= 0) & (a >= 0) & (a < grid.shape[1]) & (b >= 0) & (b < grid.shape[2])
+            indices = np.full(len(card), -1, dtype=np.int64)
+            indices[inside] = grid[card[inside], a[inside], b[inside]]
+            return indices
+
+        rows = lookup(columns['state_grid'], cards('card'),
+                      table.column('distance').to_numpy(), table.column('elixir').to_numpy())
+        cols = lookup(columns['action_grid'], cards('action_card'),
+                      table.column('action_x').to_numpy(), table.column('action_y').to_numpy())
+        values = table.column('value').to_numpy()
+        known = (rows >= 0) & (cols >= 0)
+        self.qvalues.set_many(rows[known], cols[known], values[known])
+
+    def load_legacy_qvals(self, qvals_df):
+        """Set Q-values from the old format's str((state, action)) keys, parsing each one."""
+        print("Reading", qvals_df.shape[0], "q values in the old format; export_agent or convert_qvals rewrites them.")
+        for key, value in tqdm(zip(qvals_df['S_and_A'], qvals_df['Value']), total=qvals_df.shape[0]):
+            state, action = make_tuple(key)
+            row = self.encode_state(state)
+            column = self.encode_action(action)
+            if row is not None and column is not None:
+                self.qvalues.set(row, column, value)
+
+
+    def space_key(self):
+        """Fingerprint of the state and action spaces, so a checkpoint only opens on a matching agent."""
+        return self.space.key
+
+
+def convert_qvals(filename, out=None):
+    """Rewrite a Q-value file from the old S_and_A string format into the columnar one (in place by default)."""
+    from simulation import make_deck
+    deck = make_deck(None)
+    agent = NearestTroopAgent(deck, deck, GameBoard(), sparse=True)
+    agent.load_qvals(filename)
+    agent.export_agent(out or filename)
+
+
+class TileCodedAgent(QAgent):
+    """A Q-learning agent that generalizes between states with a linear function of hashed features.
+
+    Q(state, action) is the sum of a few weights, one per feature: for each of n_tilings offset
+    tilings over (distance, elixir) with tiles distance_width x elixir_width, the tile the state
+    falls in for the state's nearest card and the action's card and region (location_cell tiles
+    square); and one for the nearest card and the action's exact placement. Features are hashed into
+    n_features weights, so memory stays fixed however much is explored, and learning about one state
+    moves its neighbours too. Weights follow semi-gradient Q-learning.
+
+    The weights live in self.qvalues, a one-row qtable.DenseQTable, so checkpoints (load, save) and
+    checkpoint.Checkpointer handle them as they do a NearestTroopAgent's table."""
+
+    def __init__(self, deck : List[GameCard], enemydeck : List[GameCard], board : GameBoard, epsilon = 0.2, discount = 0.9, learning_rate = 0.2,
+                 n_features = 1 << 15, n_tilings = 4, distance_width = 6, elixir_width = 3, location_cell = 3):
+        super().__init__(deck, enemydeck, board, epsilon, discount, learning_rate)
+        # Each update is shared between the active features
+        self.step = learning_rate / (n_tilings + 1)
+
+        self.n_features = n_features
+        self.n_tilings = n_tilings
+        self.distance_width = distance_width
+        self.elixir_width = elixir_width
+        self.location_cell = location_cell
+        self.qvalues = DenseQTable(1, n_features)
+
+        # Card codes from 1, with 0 for None and len + 1 for any card outside the space
+        self.card_codes = {name: code + 1 for name, code in self.space.qvals_columns()['card_codes'].items()}
+        self.n_cards = len(self.card_codes) + 1
+        self.distance_tiles = MAX_DISTANCE // distance_width + 2
+        self.elixir_tiles = MAX_ELIXIR // elixir_width + 2
+
+        # action_keys[t, column]: the action's part of feature t, its card and region for the tilings
+        # and its column (exact placement) for the last
+        cells_y = self.board.height // location_cell + 1
+        regions = np.array([self.card_codes[name] * (self.board.width // location_cell + 1) * cells_y
+                            + (x // location_cell) * cells_y + y // location_cell
+                            for name, (x, y) in self.actions], dtype=np.uint64)
+        self.action_keys = np.vstack([np.tile(regions, (n_tilings, 1)),
+                                      np.arange(len(self.actions), dtype=np.uint64)])
+        self.offsets = np.arange(n_tilings) / n_tilings
+
+    def state_keys(self, state):
+        """The state's part of each feature, as a (n_tilings + 1, 1) array."""
+        name, distance, elixir = state
+        card = self.card_codes.get(name, self.n_cards)
+        distance = min(max(distance, 0), MAX_DISTANCE)
+        elixir = min(max(elixir, 0), MAX_ELIXIR)
+        distance_tiles = np.floor(distance / self.distance_width + self.offsets).astype(np.int64)
+        elixir_tiles = np.floor(elixir / self.elixir_width + self.offsets).astype(np.int64)
+        tiles = ((np.arange(self.n_tilings) * self.n_cards + card) * self.distance_tiles
+                 + distance_tiles) * self.elixir_tiles + elixir_tiles
+        # The exact-placement feature, numbered past every tile
+        keys = np.append(tiles, self.n_tilings * self.n_cards * self.distance_tiles * self.elixir_tiles + card)
+        return keys.astype(np.uint64)[:, None]
+
+    def features(self, state, columns):
+        """[feature, action] weight indices of state with each action column."""
+        mixed = ((self.state_keys(state) * np.uint64(0x9E3779B97F4A7C15))
+                 ^ (self.action_keys[:, columns] * np.uint64(0xC2B2AE3D27D4EB4F)))
+        return ((mixed >> np.uint64(17)) % np.uint64(self.n_features)).astype(np.int64)
+
+    def values(self, state, columns):
+        """Q-values of state for an array of action columns."""
+        return self.qvalues.table[0, self.features(state, columns)].sum(axis=0)
+
+    def getQValue(self, state, action):
+        return float(self.values(state, np.array([self.action_indices[action]]))[0])
+
+    def computeValueFromQValues(self, state):
+        """max Q(state, action) over the legal actions."""
+        return float(self.values(state, self.legal_action_indices()).max())
+
+    def computeActionFromQValues(self, state):
+        legal = self.legal_action_indices()
+        return self.actions[legal[np.argmax(self.values(state, legal))]]
+
+    def update(self, state, action, nextState, reward: float):
+        """Move Q(state, action) toward reward + discount * max Q(nextState, .) by a semi-gradient step."""
+        features = self.features(state, np.array([self.action_indices[action]]))[:, 0]
+        error = reward + self.discount * self.computeValueFromQValues(nextState) - self.qvalues.table[0, features].sum()
+        # A feature hashed in twice takes both steps
+        features, counts = np.unique(features, return_counts=True)
+        rows = np.zeros(len(features), dtype=np.int64)
+        self.qvalues.set_many(rows, features, self.qvalues.get_many(rows, features) + self.step * error * counts)
+
+    def space_key(self):
+        """Fingerprint of the features, so a checkpoint only opens on an agent with the same ones."""
+        return hashlib.md5(repr(('tiles', self.space.key, self.n_features, self.n_tilings, self.distance_width,
+                                 self.elixir_width, self.location_cell)).encode()).hexdigest()
 
     def export_agent(self, filename):
-        new_dict = {}
-        all_keys = list(self.qvalues.keys())
-        for i in range(len(all_keys)):
-            if self.qvalues.get(all_keys[i]) != 0.0:
-                new_dict[i] = [str(all_keys[i]), self.qvalues.get(all_keys[i])]
-        qvals_df = pd.DataFrame.from_dict(new_dict, orient='index', columns=['S_and_A', 'Value'])
-        qvals_df.to_parquet(filename)
-        print("Wrote", qvals_df.shape[0], "values to", filename)
+        """Write the non-zero weights to a parquet file, tagged with the feature fingerprint."""
+        weights = self.qvalues.table[0]
+        features = np.flatnonzero(weights)
+        table = pa.table({'feature': features.astype(np.int32), 'value': weights[features]})
+        pq.write_table(table.replace_schema_metadata({WEIGHTS_METADATA_KEY: self.space_key().encode()}), filename)
+        print("Wrote", len(features), "weights to", filename)
 
     def load_qvals(self, filename):
-        qvals_df = pd.read_parquet(filename)
-        print("Reading", qvals_df.shape[0], "q values from file.")
-        for ind, val in tqdm(qvals_df.iterrows()):
-            self.qvalues[make_tuple(val[0])] = val[1]
-
+        """Set weights from a file written by export_agent."""
+        table = pq.read_table(filename)
+        if (table.schema.metadata or {}).get(WEIGHTS_METADATA_KEY) != self.space_key().encode():
+            raise ValueError(filename + " does not hold weights for this agent's features")
+        features = table.column('feature').to_numpy().astype(np.int64)
+        self.qvalues.set_many(np.zeros(len(features), dtype=np.int64), features, table.column('value').to_numpy())
 
 
+class RolloutAgent:
+    """A lookahead agent that plays candidate actions out on clones of the board for up to time_budget
+    seconds, picking rollouts by UCB1 and playing the best mean return. It does not learn."""
 
+    def __init__(self, deck : List[GameCard], enemydeck : List[GameCard], board : GameBoard, time_budget = 0.05,
+                 horizon = 10, locations_per_card = 4, discount = 0.9, exploration = 1.0, pass_probability = 0.5,
+                 elixir_interval = 2.8, max_rollouts = None):
+        self.board = board
+        self.deck = deck
+        self.is_evil = False
+        # Seconds of search per decision, and optionally a cap on rollouts per decision
+        self.time_budget = time_budget
+        self.max_rollouts = max_rollouts
+        self.horizon = horizon
+        self.locations_per_card = locations_per_card
+        self.discount = discount
+        self.exploration = exploration
+        # Chance the rollout policy passes even when it could afford a card
+        self.pass_probability = pass_probability
+        self.elixir_interval = elixir_interval
+        self.rng = random.Random()
+
+        # Search throughput over the agent's lifetime
+        self.rollouts = 0
+        self.search_time = 0.0
+
+    @property
+    def rollouts_per_second(self):
+        return self.rollouts / max(self.search_time, 1e-9)
+
+    def affordable(self, board, is_evil):
+        if is_evil:
+            return [card for card in board.evil_hand if card.cost <= board.evil_elixir_count]
+        return [card for card in board.hand if card.cost <= board.elixir_count]
+
+    def candidates(self):
+        """None, and locations_per_card random placements of each card the agent can afford."""
+        actions = [(None, (0,0))]
+        for card in self.affordable(self.board, self.is_evil):
+            count = min(self.locations_per_card, len(card.LegalDeployments))
+            actions.extend((card.name, location) for location in self.rng.sample(card.LegalDeployments, count))
+        return actions
+
+    def random_action(self, board, is_evil):
+        """The rollout policy: pass, or play a random affordable card at a random legal location."""
+        cards = self.affordable(board, is_evil)
+        if not cards or self.rng.random() < self.pass_probability:
+            return (None, (0,0))
+        card = self.rng.choice(cards)
+        return (card.name, self.rng.choice(card.LegalDeployments))
+
+    def play(self, board, action, is_evil):
+        new_card = process_action(action, board, is_evil=is_evil)
+        if new_card:
+            board.place_troop(new_card)
+
+    def payout(self, board):
+        if self.is_evil:
+            return -board.action_payout()
+        return board.action_payout()
+
+    def rollout(self, action):
+        """Discounted return of playing action now and random cards on both sides after."""
+        board = self.board.clone(seed=self.rng.getrandbits(64))
+        self.play(board, action, self.is_evil)
+        self.play(board, self.random_action(board, not self.is_evil), not self.is_evil)
+        total = self.payout(board)
+        weight = 1.0
+        # The agent cannot see where the game's elixir timer is, so it starts a fresh one, unless the
+        # board pays elixir from its own event heap, which the clone copies along with the real timer
+        next_elixir = self.elixir_interval
+        if hasattr(board, 'schedule_elixir'):
+            if board.elixir_interval is None:
+                board.schedule_elixir(self.elixir_interval)
+            next_elixir = math.inf
+        for tick in range(1, self.horizon + 1):
+            while next_elixir <= tick:
+                board.increment_elixir()
+                next_elixir += self.elixir_interval
+            board.update_state()
+            if board.game_over:
+                break
+            self.play(board, self.random_action(board, self.is_evil), self.is_evil)
+            self.play(board, self.random_action(board, not self.is_evil), not self.is_evil)
+            weight *= self.discount
+            total += weight * self.payout(board)
+        return total
 
+    def getAction(self, state):
+        """Search for time_budget seconds and play the candidate with the best mean return."""
+        start = time.perf_counter()
+        actions = self.candidates()
+        if len(actions) == 1:
+            return actions[0]
+        totals = [0.0] * len(actions)
+        counts = [0] * len(actions)
+        rollouts = 0
+        while True:
+            if rollouts < len(actions):
+                # Try everything once first
+                choice = rollouts
+            else:
+                # UCB1, with exploration scaled to the size of the returns seen so far
+                scale = max(abs(total / count) for total, count in zip(totals, counts)) or 1.0
+                bonus = self.exploration * scale * math.sqrt(math.log(rollouts))
+                choice = max(range(len(actions)),
+                             key=lambda i: totals[i] / counts[i] + bonus / math.sqrt(counts[i]))
+            totals[choice] += self.rollout(actions[choice])
+            counts[choice] += 1
+            rollouts += 1
+            if time.perf_counter() - start >= self.time_budget:
+                break
+            if self.max_rollouts is not None and rollouts >= self.max_rollouts:
+                break
+
+        self.rollouts += rollouts
+        self.search_time += time.perf_counter() - start
+        best = max((i for i in range(len(actions)) if counts[i]), key=lambda i: totals[i] / counts[i])
+        return actions[best]
 
+    def update(self, state, action, nextState, reward: float):
+        """Nothing to learn: every decision is searched afresh."""
+        return
@@ -0,0 +1,123 @@
+"""Experience replay: a fixed-capacity ring buffer of encoded transitions for batched Q-learning."""
+
+import numpy as np
+
+
+class SumTree:
+    """Priorities in the leaves of a binary tree whose nodes hold their children's sum.
+
+    Setting leaves and drawing them in proportion to their priorities both take O(log capacity)
+    per leaf. Node 1 is the root and node i's children are 2i and 2i + 1."""
+    def __init__(self, capacity):
+        self.leaves = 1
+        while self.leaves < capacity:
+            self.leaves *= 2
+        self.depth = self.leaves.bit_length() - 1
+        self.nodes = np.zeros(2 * self.leaves, dtype=np.float64)
+
+    def total(self):
+        return self.nodes[1]
+
+    def get(self, slots):
+        return self.nodes[self.leaves + slots]
+
+    def set(self, slots, priorities):
+        """Set the leaves at slots, then every sum above them one level at a time."""
+        nodes = self.leaves + np.asarray(slots)
+        self.nodes[nodes] = priorities
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.nodes[nodes] = self.nodes[2 * nodes] + self.nodes[2 * nodes + 1]
+
+    def find(self, values):
+        """The leaf slot where each value in [0, total) falls when the leaves are laid end to end."""
+        nodes = np.ones(len(values), dtype=np.int64)
+        values = np.array(values, dtype=np.float64)
+        for _ in range(self.depth):
+            left = self.nodes[2 * nodes]
+            right = values >= left
+            values -= left * right
+            nodes = 2 * nodes + right
+        return nodes - self.leaves
+
+
+class ReplayBuffer:
+    """The last capacity transitions (state, action, reward, next state, next legal actions) in parallel arrays.
+
+    States and actions are table indices, a next state of -1 is one outside the state space (its
+    value counts as 0), and next_legal is an AgentSpace.legal_id. Sampling is uniform, or with
+    prioritized, proportional to (|TD error| + epsilon) ** alpha as last reported through
+    update_priorities (kept in a SumTree, so drawing a batch costs O(batch size x log capacity)); new
+    transitions get the highest priority seen so they are sampled at least once."""
+    def __init__(self, capacity=100000, prioritized=False, alpha=0.6, beta=0.4, epsilon=0.01, seed=None):
+        self.capacity = capacity
+        self.states = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int32)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros(capacity, dtype=np.int32)
+        self.next_legal = np.zeros(capacity, dtype=np.int32)
+        self.prioritized = prioritized
+        self.priorities = SumTree(capacity) if prioritized else None
+        self.max_priority = 1.0
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.rng = np.random.default_rng(seed)
+        # Next slot to write, and how many slots hold a transition
+        self.position = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def add(self, state, action, reward, next_state, next_legal):
+        """Store one transition, overwriting the oldest once full."""
+        slot = self.position
+        self.states[slot] = state
+        self.actions[slot] = action
+        self.rewards[slot] = reward
+        self.next_states[slot] = next_state
+        self.next_legal[slot] = next_legal
+        if self.prioritized:
+            self.priorities.set([slot], self.max_priority)
+        self.position = (slot + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def add_many(self, states, actions, rewards, next_states, next_legal):
+        """Store arrays of transitions, as add does one at a time."""
+        count = len(states)
+        if count > self.capacity:
+            states, actions, rewards, next_states, next_legal = (
+                column[-self.capacity:] for column in (states, actions, rewards, next_states, next_legal))
+            count = self.capacity
+        slots = (self.position + np.arange(count)) % self.capacity
+        self.states[slots] = states
+        self.actions[slots] = actions
+        self.rewards[slots] = rewards
+        self.next_states[slots] = next_states
+        self.next_legal[slots] = next_legal
+        if self.prioritized:
+            self.priorities.set(slots, self.max_priority)
+        self.position = (self.position + count) % self.capacity
+        self.count = min(self.count + count, self.capacity)
+
+    def sample(self, batch_size):
+        """(slots, weights) of batch_size transitions drawn with replacement.
+
+        weights are the importance-sampling corrections for prioritized draws, scaled to at most 1,
+        or all ones when uniform."""
+        if not self.prioritized:
+            return self.rng.integers(0, self.count, size=batch_size), np.ones(batch_size, dtype=np.float32)
+        total = self.priorities.total()
+        # Rounding can land a draw on an empty leaf past the last transition
+        slots = np.minimum(self.priorities.find(self.rng.random(batch_size) * total), self.count - 1)
+        probabilities = self.priorities.get(slots) / total
+        weights = (self.count * probabilities) ** -self.beta
+        return slots, (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, slots, errors):
+        """Re-prioritize sampled transitions by their latest TD errors."""
+        if self.prioritized:
+            priorities = (np.abs(errors) + self.epsilon) ** self.alpha
+            self.priorities.set(slots, priorities)
+            self.max_priority = max(self.max_priority, float(priorities.max()))
@@ -6,8 +6,12 @@ import pyglet as pg
 import pyglet.graphics as graphics
 import pyglet.gl as gl
 import random
+import time
 from board import *
 from clash_agents import *
+from simulation import *
+from view import BoardView
+from checkpoint import Checkpointer, checkpoint_name
 
 ###### GLOBAL PARAMS ######
 speedup_factor = 100
@@ -18,8 +22,26 @@ LOSSES = 0
 
 STATES_INIT = 0
 
-episode_name = "weights_toward_5096.parquet"
-MODEL_FILE = "weights_toward_5096.parquet"
+# Turbo mode (T) runs TICKS_PER_FRAME simulation ticks per rendered frame instead of one per timer callback.
+# TICKS_PER_FRAME is chosen to hold TARGET_FPS unless set by hand with +/- and LEFT/RIGHT (A to go back to adaptive).
+# Uncapped mode (U) simulates flat out and only renders a snapshot every SNAPSHOT_INTERVAL seconds.
+TURBO = False
+UNCAPPED = False
+ADAPTIVE = True
+TARGET_FPS = 30
+SNAPSHOT_INTERVAL = 1.0
+TICKS_PER_FRAME = 1
+# Running estimates used to size a turbo frame: seconds per tick and per render, and ticks per second achieved
+TICK_TIME = 0.001
+DRAW_TIME = 0.0
+TICK_RATE = 0
+
+# A .npy checkpoint, so the adversary memory-maps it instead of keeping its own copy
+episode_name = "weights_toward_5096.npy"
+MODEL_FILE = "weights_toward_5096.npy"
+# The agent's changes are checkpointed in the background every CHECKPOINT_EVERY episodes to the
+# .npy checkpoint beside episode_name, so a crash loses at most that many episodes of learning
+CHECKPOINT_EVERY = 10
 
 ###### GLOBAL PARAMS ######
 
@@ -58,13 +80,8 @@ tile_size = (600 * 0.8) / 18
 
 ####### INITIALIZE GAME AND AGENTS #########
 
-BOARD = GameBoard(tile_size, None)
-deck = [Barbarians((0,0), BOARD), Zap((0,0), BOARD), MiniPekka((0,0), BOARD), HogRider((0,0), BOARD),
-        Archers((0,0), BOARD), Bomber((0,0), BOARD), BabyDragon((0,0), BOARD), Goblins((0,0), BOARD)]
-BOARD.deck = deck
-[BOARD.draw_card() for i in range(4)]
-[BOARD.draw_evil_card() for j in range(4)]
-tile_view = False
+BOARD = GameBoard()
+deck = make_deck(BOARD)
 verbose_mode = True
 
 # AGENT = RandomLegalAgent(deck, deck, BOARD)
@@ -72,34 +89,33 @@ AGENT = NearestTroopAgent(deck, deck, BOARD)
 EVIL_AGENT = NearestTroopAgent(deck, deck, BOARD)
 EVIL_AGENT.is_evil = True
 
-USE_COUNTS = {}
-for card in deck:
-    USE_COUNTS[card.name] = 0
-
 ####### INITIALIZE GAME AND AGENTS #########
 
 if MODEL_FILE:
-    AGENT.load_qvals(MODEL_FILE)
-    EVIL_AGENT.load_qvals(MODEL_FILE)
-last_action = None
+    AGENT.load(MODEL_FILE)
+    # The adversary never learns, so it maps the file read-only rather than keeping a copy
+    EVIL_AGENT.load(MODEL_FILE, frozen=True)
+
+CHECKPOINTER = Checkpointer(AGENT, checkpoint_name(episode_name), every=CHECKPOINT_EVERY)
+
+SIM = Simulation(deck, AGENT, EVIL_AGENT, verbose_mode=verbose_mode)
+BOARD = SIM.board
+USE_COUNTS = SIM.use_counts
+VIEW = BoardView(tile_size, BOARD)
 
 
 def reset():
     """Resets board and game (but NOT agent), triggers next episode."""
     global CURR_EPISODE
     global BOARD
-    global AGENT
-    global EVIL_AGENT
     global WINS
     global LOSSES
 
     # Remove previous schedule
-    pg.clock.unschedule(BOARD.increment_elixir)
-    pg.clock.unschedule(BOARD.update_state)
-    pg.clock.unschedule(dispatch_agent)
-    pg.clock.unschedule(dispatch_evil_agent)
+    unschedule_events()
 
     CURR_EPISODE += 1
+    CHECKPOINTER.episode_done()
     if BOARD.won:
         WINS += 1
     else:
@@ -111,8 +127,10 @@ def reset():
         total_use = sum(list(USE_COUNTS.values()))
         for key in USE_COUNTS:
             print("Agent used", key, round(100*USE_COUNTS[key]/total_use,2), "% of the time.")
+        report_coverage(AGENT)
 
-        AGENT.export_agent(episode_name)
+        CHECKPOINTER.close()
+        AGENT.save(episode_name)
         print("Export completed.")
         print("=================================")
         print(" ")
@@ -120,157 +138,96 @@ def reset():
         window.close()
 
     else:
-        # Reset board and reference for agent
-        del BOARD
-        BOARD = GameBoard(tile_size, deck)
+        # Reset board and reference for agents and view
+        BOARD = SIM.reset()
+        VIEW.attach(BOARD)
         count_states(AGENT)
-        AGENT.board = BOARD
-        EVIL_AGENT.board = BOARD
 
         # Create new schedule
-        pg.clock.schedule_interval(BOARD.increment_elixir, (1 / speedup_factor) * 2.8)
-        pg.clock.schedule_interval(BOARD.update_state, (1 / speedup_factor) * 1)
-
-        # Dispatch game state to NN / RL net
-        pg.clock.schedule_interval(dispatch_agent, (1 / speedup_factor) * 1)
-        pg.clock.schedule_interval(dispatch_evil_agent, (1 / speedup_factor) * 1)
+        schedule_events()
 
 
 
 
 def count_states(AGENT):
-    """A function to return what % of qvalues have been initialized."""
+    """A function to return what % of qvalues have been initialized (the table keeps a running count)."""
     global STATES_INIT
-    total = 0
-
-    for key in AGENT.qvalues:
-        if AGENT.qvalues.get(key) != 0.0:
-            total += 1
-    STATES_INIT = total / len(AGENT.qvalues.keys())
-    print("So far have explored", total, "out of ", len(AGENT.qvalues.keys()))
-
-def process_action(action, is_evil=False):
-    """A function to take an agent's action and turn it into troop generation."""
-    card, location = action
-    if is_evil:
-        location = invert_location(location)
-    if card is None:
-        return
-    if card == 'barbarians':
-        return Barbarians(location, BOARD, is_evil=is_evil)
-    if card == 'zap':
-        return Zap(location, BOARD, is_evil=is_evil)
-    if card == 'mini pekka':
-        return MiniPekka(location, BOARD, is_evil=is_evil)
-    if card == 'hog rider':
-        return HogRider(location, BOARD, is_evil=is_evil)
-    if card == 'archers':
-        return Archers(location, BOARD, is_evil=is_evil)
-    if card == 'bomber':
-        return Bomber(location, BOARD, is_evil=is_evil)
-    if card == 'baby dragon':
-        return BabyDragon(location, BOARD, is_evil=is_evil)
-    if card == 'goblins':
-        return Goblins(location, BOARD, is_evil=is_evil)
+    total = AGENT.qvalues.count_nonzero()
+    STATES_INIT = total / AGENT.qvalues.size
+    print("So far have explored", total, "out of ", AGENT.qvalues.size)
+
+
+def report_coverage(AGENT):
+    """Prints how much of the Q-table has been explored for each nearest card and elixir count."""
+    explored, size, by_card, by_elixir = AGENT.coverage()
+    print("Agent explored", explored, "of", size, "Q values (", round(100 * explored / size, 2), "% ).")
+    for card, (found, total) in by_card.items():
+        print("  nearest", card if card else "(none)", round(100 * found / total, 2), "% explored")
+    for elixir, (found, total) in by_elixir.items():
+        print("  at", elixir, "elixir", round(100 * found / total, 2), "% explored")
 
 def dispatch_agent(dt=None):
     """A function to update the agent."""
-    state = nearest_troop_agent_state(False)
-    action = AGENT.getAction(state)
-    new_card = process_action(action)
-    if verbose_mode:
-        if new_card:
-            print("Agent plays", new_card.name, "!")
-            USE_COUNTS[new_card.name] += 1
-            BOARD.place_troop(new_card)
-        else:
-            print("Agent plays None.")
-
-    # Update the Q-values of the agent based on the results of its last action, now that the following state is known
-    if BOARD.last_state and BOARD.last_action:
-        AGENT.update(BOARD.last_state, BOARD.last_action, state, BOARD.last_payout)
-    BOARD.last_state = state
-    BOARD.last_action = action
-    BOARD.last_payout = BOARD.action_payout()
+    SIM.dispatch_agent()
 
 def dispatch_evil_agent(dt=None):
     """Call the evil agent to make a move. DO NOT update agent."""
-    state = nearest_troop_agent_state(True)
-    action = EVIL_AGENT.getAction(state)
-    new_card = process_action(action, is_evil=True)
-    if verbose_mode:
-        if new_card:
-            print("ADVERSARY plays", new_card.name, "!")
-            BOARD.place_troop(new_card)
-        else:
-            print("ADVERSARY plays None.")
-
-
-def invert_location(location):
-    x,y = location
-    new_y = 30 - y
-    return (x, new_y)
-
-def nearest_troop_agent_state(is_evil):
-    """Get state for a nearest troop agent as (nearest_card.name, nearest_card.location, elixir_count)"""
-    if not is_evil:
-        troops = [troop for troop in BOARD.live_evil_troops if troop.target]
-        elixir = BOARD.elixir_count
-    else:
-        troops = [troop for troop in BOARD.live_troops if troop.target]
-        elixir = BOARD.evil_elixir_count
-    # If there exists a troop on the board targeting agent:
-    if troops:
-        closest_troop = min(troops, key=lambda troop: troop.target_distance())
-        return (closest_troop.name, int(closest_troop.target_distance()), elixir)
-    # Else, consider no troops.
-    else:
-        return (None, 0, elixir)
-
-
+    SIM.dispatch_evil_agent()
 
 
 def ML_GUI(dt = None):
     """Renders ML progress."""
-    EPI_NUM = pg.text.Label("EPISODE "+str(CURR_EPISODE), font_name='Times New Roman', font_size=24,
-                                         x= 100, y=770, anchor_x='center',
-                                         anchor_y='center')
-    EPI_NUM.draw()
-
-    state_count = pg.text.Label("Explored "+str(round(STATES_INIT*100,2))+" % of states", font_size=12,
-                                         x= 100, y=740, anchor_x='center',
-                                         anchor_y='center')
-    state_count.draw()
-
-    win_rate = pg.text.Label("Win Rate="+str(round(100*WINS/(WINS+LOSSES+0.001),2))+"%", font_size=10, x = 80, y=720,
-                             anchor_x='center',
-                             anchor_y='center'
-                             )
-    win_rate.draw()
+    VIEW.text('episode', "EPISODE "+str(CURR_EPISODE), font_name='Times New Roman', font_size=24, x= 100, y=770)
+    VIEW.text('explored', "Explored "+str(round(STATES_INIT*100,2))+" % of states", font_size=12, x= 100, y=740)
+    VIEW.text('win rate', "Win Rate="+str(round(100*WINS/(WINS+LOSSES+0.001),2))+"%", font_size=10, x = 80, y=720)
 
 def SPEED_GUI(dt = None):
     """Renders current simulation speed"""
-    SPEED = pg.text.Label(str(speedup_factor)+"x speed", font_size=10,
-                                         x= 500, y=770, anchor_x='center',
-                                         anchor_y='center')
-    SPEED.draw()
+    if UNCAPPED:
+        speed = "uncapped: "+str(int(TICK_RATE))+" ticks/s"
+    elif TURBO:
+        speed = "turbo: "+str(TICKS_PER_FRAME)+" ticks/frame"+(" (auto)" if ADAPTIVE else "")
+    else:
+        speed = str(speedup_factor)+"x speed"
+    VIEW.text('speed', speed, font_size=10, x= 500, y=770)
+
+
+def turbo_tick(dt=None):
+    """Run a frame's worth of simulation ticks back to back, or a whole snapshot interval's worth if uncapped."""
+    global TICKS_PER_FRAME
+    global TICK_TIME
+    global TICK_RATE
+    if ADAPTIVE and not UNCAPPED:
+        # Leave the rest of the frame for rendering
+        budget = max(1 / TARGET_FPS - DRAW_TIME, 0.001)
+        TICKS_PER_FRAME = max(1, int(budget / TICK_TIME))
+
+    start = time.perf_counter()
+    ticks = 0
+    while (time.perf_counter() - start < SNAPSHOT_INTERVAL) if UNCAPPED else (ticks < TICKS_PER_FRAME):
+        ticks += 1
+        if not SIM.step():
+            reset()
+            if CURR_EPISODE >= EPISODES:
+                return
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    TICK_TIME = 0.8 * TICK_TIME + 0.2 * elapsed / ticks
+    TICK_RATE = ticks / elapsed
 
 
 @window.event
 def on_draw():
     """Main render loop for all frames."""
+    global DRAW_TIME
     if not BOARD.game_over:
+        start = time.perf_counter()
         window.clear()
         board_backdrop.blit(0.1 * window.width,0.1 * window.height, width=window.width * 0.8, height=window.height * 0.8)
-        BOARD.render_tiles()
-        BOARD.render_elixir()
-        BOARD.render_clock()
-        BOARD.draw_troops()
-        BOARD.render_score()
-        BOARD.win_condition()
-        BOARD.render_hand()
+        # The GUI labels live in the view's batch, so update them before it draws
         ML_GUI()
         SPEED_GUI()
+        VIEW.draw()
+        DRAW_TIME = time.perf_counter() - start
     else:
         reset()
 
@@ -280,8 +237,27 @@ def on_key_press(symbol, modifiers):
     """Event handler; processes tile view and speed modifiers."""
     global speedup_factor
     global verbose_mode
+    global TURBO
+    global UNCAPPED
+    global ADAPTIVE
+    global TICKS_PER_FRAME
     if symbol == pg.window.key.D:
-        BOARD.tile_view = not BOARD.tile_view
+        VIEW.tile_view = not VIEW.tile_view
+    elif symbol == pg.window.key.T:
+        TURBO = not TURBO
+        reschedule_events()
+    elif symbol == pg.window.key.U:
+        UNCAPPED = not UNCAPPED
+        reschedule_events()
+    elif symbol == pg.window.key.A:
+        ADAPTIVE = True
+    elif TURBO and symbol in (pg.window.key.PLUS, pg.window.key.MINUS, pg.window.key.RIGHT, pg.window.key.LEFT):
+        # In turbo the speed keys set ticks per frame by hand
+        ADAPTIVE = False
+        step = 1 if symbol in (pg.window.key.PLUS, pg.window.key.MINUS) else 5
+        if symbol in (pg.window.key.MINUS, pg.window.key.LEFT):
+            step = -step
+        TICKS_PER_FRAME = max(1, TICKS_PER_FRAME + step)
     elif symbol == pg.window.key.MINUS:
         if speedup_factor > 1:
             speedup_factor -= 1
@@ -298,28 +274,34 @@ def on_key_press(symbol, modifiers):
         reschedule_events()
     elif symbol == pg.window.key.V:
         verbose_mode = not verbose_mode
-        BOARD.verbose_mode = not verbose_mode
+        SIM.verbose_mode = verbose_mode
 
-def reschedule_events():
+def unschedule_events():
+    pg.clock.unschedule(turbo_tick)
     pg.clock.unschedule(BOARD.increment_elixir)
     pg.clock.unschedule(BOARD.update_state)
 
     pg.clock.unschedule(dispatch_agent)
     pg.clock.unschedule(dispatch_evil_agent)
 
+def schedule_events():
+    if TURBO or UNCAPPED:
+        # SIM.step paces elixir itself, so one callback drives everything
+        pg.clock.schedule_interval(turbo_tick, 1 / TARGET_FPS)
+        return
     pg.clock.schedule_interval(BOARD.increment_elixir, (1 / speedup_factor) * 2.8)
     pg.clock.schedule_interval(BOARD.update_state, (1 / speedup_factor) * 1)
 
+    # Dispatch game state to NN / RL net
     pg.clock.schedule_interval(dispatch_agent, (1 / speedup_factor) * 1)
     pg.clock.schedule_interval(dispatch_evil_agent, (1 / speedup_factor) * 1)
 
-count_states(AGENT)
-pg.clock.schedule_interval(BOARD.increment_elixir, (1/speedup_factor)*2.8)
-pg.clock.schedule_interval(BOARD.update_state, (1/speedup_factor)*1)
+def reschedule_events():
+    unschedule_events()
+    schedule_events()
 
-# Dispatch game state to NN / RL net
-pg.clock.schedule_interval(dispatch_agent, (1/speedup_factor)*1)
-pg.clock.schedule_interval(dispatch_evil_agent, (1/speedup_factor)*1)
+count_states(AGENT)
+schedule_events()
 
 
-pg.app.run()
\ No newline at end of file
+pg.app.run()
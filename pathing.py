@@ -0,0 +1,78 @@
+"""Flow fields: walking distances over the board's fixed legality grid, for troop pathing."""
+
+from collections import deque
+
+import numpy as np
+
+UNREACHABLE = np.inf
+
+# One FlowFields per distinct board layout, shared by every board built on it
+_LAYOUTS = {}
+
+
+def flow_fields(width, height, illegal_spaces):
+    """The process-wide FlowFields for a width x height board with these illegal tiles."""
+    key = (width, height, frozenset(illegal_spaces))
+    paths = _LAYOUTS.get(key)
+    if paths is None:
+        walls = np.zeros((height, width), dtype=bool)
+        for x, y in key[2]:
+            walls[y, x] = True
+        paths = _LAYOUTS[key] = FlowFields(walls)
+    return paths
+
+
+class FlowFields:
+    """Breadth-first distance fields to goal tiles on one board layout, built on first use and kept.
+
+    field(goal)[y, x] is the number of left/right/up/down steps from (x, y) to goal over legal tiles,
+    so walking it downhill crosses the river at a bridge instead of pushing into it. A goal on an
+    illegal tile, such as a tower's location, is reached through the block of illegal tiles it sits in
+    (the tower's footprint). Tiles that cannot reach the goal are UNREACHABLE."""
+    def __init__(self, walls):
+        self.walls = walls
+        self.height, self.width = walls.shape
+        self.fields = {}
+
+    def field(self, goal):
+        """Read-only float32 [y, x] grid of steps to goal, which must be on the board."""
+        field = self.fields.get(goal)
+        if field is None:
+            field = self.fields[goal] = self.build(goal)
+        return field
+
+    def footprint(self, goal):
+        """The illegal tiles connected to goal, itself an illegal tile."""
+        tiles = {goal}
+        frontier = [goal]
+        while frontier:
+            x, y = frontier.pop()
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                if (0 <= nx < self.width and 0 <= ny < self.height and self.walls[ny, nx]
+                        and (nx, ny) not in tiles):
+                    tiles.add((nx, ny))
+                    frontier.append((nx, ny))
+        return tiles
+
+    def build(self, goal):
+        width, height = self.width, self.height
+        passable = (~self.walls).ravel().tolist()
+        gx, gy = goal
+        if self.walls[gy, gx]:
+            for x, y in self.footprint(goal):
+                passable[y * width + x] = True
+        # BFS over a flat python list, which is far quicker to index one tile at a time than an array
+        steps = [UNREACHABLE] * (width * height)
+        steps[gy * width + gx] = 0
+        queue = deque([goal])
+        while queue:
+            x, y = queue.popleft()
+            next_steps = steps[y * width + x] + 1
+            for nx, ny in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)):
+                tile = ny * width + nx
+                if 0 <= nx < width and 0 <= ny < height and passable[tile] and steps[tile] == UNREACHABLE:
+                    steps[tile] = next_steps
+                    queue.append((nx, ny))
+        field = np.array(steps, dtype=np.float32).reshape(height, width)
+        field.setflags(write=False)
+        return field
@@ -0,0 +1,333 @@
+"""Q-value tables indexed by encoded (state, action) integers, dense or sparse behind one interface."""
+
+import glob
+import json
+import os
+from itertools import islice
+
+import numpy as np
+
+# A checkpoint is a float32 [state, action] .npy base (the name plus .base-<n>.npy), which can be
+# memory-mapped, named by a JSON sidecar (the name plus .json) that also holds the format version,
+# shape, the agent's space key and the last delta the base includes. Deltas (the name plus
+# .delta-<n>.npz) each hold the values changed since the previous one; a checkpoint reads as its
+# base with every later delta applied in order. Sidecars naming no base read the name itself.
+CHECKPOINT_VERSION = 1
+CHECKPOINT_SUFFIX = '.npy'
+BASE_SUFFIX = '.base-'
+DELTA_SUFFIX = '.delta-'
+
+
+class DenseQTable:
+    """Every Q-value in one float32 array indexed [state, action].
+
+    Fast to read in bulk, but its memory is the whole state x action space whatever has been explored."""
+    def __init__(self, n_states, n_actions, table=None):
+        # Non-zero values per state and in all, kept up to date as values are set. For a given table,
+        # e.g. a memory-mapped checkpoint, they are only counted when first asked for.
+        self.row_nonzero = None
+        self.nonzero = 0
+        if table is None:
+            table = np.zeros((n_states, n_actions), dtype=np.float32)
+            self.row_nonzero = np.zeros(n_states, dtype=np.int64)
+        self.table = table
+        self.shape = self.table.shape
+        self.size = self.table.size
+        # Flat indices set since the last take_changes, once track_changes has been called
+        self.changed = None
+
+    def get(self, state, action):
+        return float(self.table[state, action])
+
+    def set(self, state, action, value):
+        if self.row_nonzero is not None:
+            was_set = self.table[state, action] != 0
+            self.table[state, action] = value
+            change = int(self.table[state, action] != 0) - int(was_set)
+            self.row_nonzero[state] += change
+            self.nonzero += change
+        else:
+            self.table[state, action] = value
+        if self.changed is not None:
+            self.changed.add(state * self.shape[1] + action)
+
+    def set_many(self, states, actions, values):
+        """Set values[i] at (states[i], actions[i]) for arrays of each."""
+        flat = np.asarray(states) * self.shape[1] + np.asarray(actions)
+        if self.row_nonzero is not None:
+            rows, columns = np.divmod(np.unique(flat), self.shape[1])
+            was_set = self.table[rows, columns] != 0
+            self.table[states, actions] = values
+            change = (self.table[rows, columns] != 0).astype(np.int64) - was_set
+            np.add.at(self.row_nonzero, rows, change)
+            self.nonzero += int(change.sum())
+        else:
+            self.table[states, actions] = values
+        if self.changed is not None:
+            self.changed.update(flat.tolist())
+
+    def track_changes(self):
+        """Start recording which entries are set, for take_changes."""
+        self.changed = set()
+
+    def take_changes(self):
+        """(states, actions, values) arrays of the entries set since the last call, which are then forgotten."""
+        flat = np.fromiter(self.changed, dtype=np.int64, count=len(self.changed))
+        flat.sort()
+        self.changed = set()
+        states, actions = np.divmod(flat, self.shape[1])
+        return states, actions, self.table[states, actions]
+
+    def values(self, state, actions):
+        """Q-values of state for an array of actions."""
+        return self.table[state, actions]
+
+    def get_many(self, states, actions):
+        """Q-values at (states[i], actions[i]) for arrays of each."""
+        return self.table[states, actions]
+
+    def state_rows(self, states):
+        """[len(states), n_actions] array of every Q-value of each state."""
+        return self.table[states]
+
+    def items(self):
+        """(state, action, value) for every non-zero value, in state then action order."""
+        states, actions = np.nonzero(self.table)
+        return zip(states.tolist(), actions.tolist(), self.table[states, actions].tolist())
+
+    def chunks(self, size):
+        """items() as (states, actions, values) arrays of at most size entries each."""
+        states, actions = np.nonzero(self.table)
+        for start in range(0, len(states), size):
+            rows, columns = states[start:start + size], actions[start:start + size]
+            yield rows, columns, self.table[rows, columns]
+
+    def nonzero_by_state(self):
+        """Read-only count of non-zero values in each state's row."""
+        if self.row_nonzero is None:
+            self.row_nonzero = np.count_nonzero(self.table, axis=1).astype(np.int64)
+            self.nonzero = int(self.row_nonzero.sum())
+        view = self.row_nonzero.view()
+        view.setflags(write=False)
+        return view
+
+    def count_nonzero(self):
+        if self.row_nonzero is None:
+            self.nonzero_by_state()
+        return self.nonzero
+
+    def to_array(self):
+        return self.table
+
+
+class SparseQTable:
+    """Only the Q-values that have been set, one small dict per visited state; all others read as 0.0.
+
+    Building one costs nothing and its memory grows with what the agent has explored. Values are
+    rounded to float32 as they are stored, so an agent learns exactly as it would on a DenseQTable."""
+    def __init__(self, n_states, n_actions):
+        self.shape = (n_states, n_actions)
+        self.size = n_states * n_actions
+        # {state: {action: value}}
+        self.rows = {}
+        # Non-zero values per state and in all, kept up to date as values are set
+        self.row_nonzero = np.zeros(n_states, dtype=np.int64)
+        self.nonzero = 0
+        # (state, action) pairs set since the last take_changes, once track_changes has been called
+        self.changed = None
+
+    def get(self, state, action):
+        row = self.rows.get(state)
+        if row is None:
+            return 0.0
+        return row.get(action, 0.0)
+
+    def set(self, state, action, value):
+        row = self.rows.get(state)
+        if row is None:
+            row = self.rows[state] = {}
+        was_set = row.get(action, 0.0) != 0.0
+        value = row[action] = float(np.float32(value))
+        change = (value != 0.0) - was_set
+        if change:
+            self.row_nonzero[state] += change
+            self.nonzero += change
+        if self.changed is not None:
+            self.changed.add((state, action))
+
+    def track_changes(self):
+        """Start recording which entries are set, for take_changes."""
+        self.changed = set()
+
+    def take_changes(self):
+        """(states, actions, values) arrays of the entries set since the last call, which are then forgotten."""
+        changed = sorted(self.changed)
+        self.changed = set()
+        states = np.array([state for state, _ in changed], dtype=np.int64)
+        actions = np.array([action for _, action in changed], dtype=np.int64)
+        values = np.array([self.rows[state][action] for state, action in changed], dtype=np.float32)
+        return states, actions, values
+
+    def set_many(self, states, actions, values):
+        """Set values[i] at (states[i], actions[i]) for arrays of each."""
+        for state, action, value in zip(states.tolist(), actions.tolist(), values.tolist()):
+            self.set(state, action, value)
+
+    def get_many(self, states, actions):
+        """Q-values at (states[i], actions[i]) for arrays of each."""
+        return np.array([self.get(state, action) for state, action in zip(states.tolist(), actions.tolist())],
+                        dtype=np.float32)
+
+    def state_rows(self, states):
+        """[len(states), n_actions] array of every Q-value of each state."""
+        out = np.zeros((len(states), self.shape[1]), dtype=np.float32)
+        for i, state in enumerate(states.tolist()):
+            row = self.rows.get(state)
+            if row:
+                out[i, list(row.keys())] = list(row.values())
+        return out
+
+    def values(self, state, actions):
+        """Q-values of state for an array of actions."""
+        out = np.zeros(len(actions), dtype=np.float32)
+        row = self.rows.get(state)
+        if row:
+            stored = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+            order = np.argsort(stored)
+            stored = stored[order]
+            values = np.fromiter(row.values(), dtype=np.float32, count=len(row))[order]
+            where = np.minimum(np.searchsorted(stored, actions), len(stored) - 1)
+            hit = stored[where] == actions
+            out[hit] = values[where[hit]]
+        return out
+
+    def items(self):
+        """(state, action, value) for every non-zero value, in state then action order."""
+        for state in sorted(self.rows):
+            row = self.rows[state]
+            for action in sorted(row):
+                if row[action] != 0.0:
+                    yield state, action, row[action]
+
+    def chunks(self, size):
+        """items() as (states, actions, values) arrays of at most size entries each."""
+        items = self.items()
+        while True:
+            chunk = list(islice(items, size))
+            if not chunk:
+                return
+            states, actions, values = zip(*chunk)
+            yield np.array(states), np.array(actions), np.array(values, dtype=np.float32)
+
+    def nonzero_by_state(self):
+        """Read-only count of non-zero values in each state's row."""
+        view = self.row_nonzero.view()
+        view.setflags(write=False)
+        return view
+
+    def count_nonzero(self):
+        return self.nonzero
+
+    def to_array(self):
+        """A dense float32 copy."""
+        table = np.zeros(self.shape, dtype=np.float32)
+        for states, actions, values in self.chunks(65536):
+            table[states, actions] = values
+        return table
+
+
+########## CHECKPOINTS ##########
+
+def delta_filename(filename, number):
+    return filename + DELTA_SUFFIX + str(number) + '.npz'
+
+
+def delta_numbers(filename):
+    """Numbers of the deltas on disk for a checkpoint, ascending."""
+    pattern = glob.escape(filename + DELTA_SUFFIX) + '*.npz'
+    return sorted(int(path[len(filename + DELTA_SUFFIX):-len('.npz')]) for path in glob.glob(pattern))
+
+
+def base_filename(filename, number):
+    return filename + BASE_SUFFIX + str(number) + '.npy'
+
+
+def checkpoint_base(filename, meta):
+    """The base file a checkpoint's sidecar names, beside the sidecar."""
+    if 'base' not in meta:
+        return filename
+    return os.path.join(os.path.dirname(filename), meta['base'])
+
+
+def checkpoint_meta(filename):
+    """The checkpoint's sidecar, or None if it has no base yet."""
+    if not os.path.exists(filename + '.json'):
+        return None
+    with open(filename + '.json') as file:
+        return json.load(file)
+
+
+def save_checkpoint(qtable, filename, space_key, through=None):
+    """Write qtable as a checkpoint's base; filename should end in CHECKPOINT_SUFFIX.
+
+    The base supersedes deltas up to number through (by default every delta on disk), which are
+    then deleted. The base goes to a new numbered file and only replacing the sidecar to name it
+    commits the save, so readers never open a half-written base and a crash at any point leaves
+    the old base or the new one, each with the through it was written with."""
+    meta = checkpoint_meta(filename)
+    if through is None:
+        numbers = delta_numbers(filename)
+        through = numbers[-1] if numbers else 0
+        if meta is not None:
+            through = max(through, meta.get('through', 0))
+    number = 1
+    if meta is not None:
+        number = meta.get('base_number', 0) + 1
+    base = base_filename(filename, number)
+    table = qtable.to_array()
+    with open(base, 'wb') as file:
+        np.save(file, table)
+    with open(filename + '.json.tmp', 'w') as file:
+        json.dump({'version': CHECKPOINT_VERSION, 'shape': list(table.shape), 'space': space_key,
+                   'through': through, 'base': os.path.basename(base), 'base_number': number}, file)
+    os.replace(filename + '.json.tmp', filename + '.json')
+
+    # Superseded bases, including any a crashed save left behind, and deltas
+    pattern = glob.escape(filename + BASE_SUFFIX) + '*.npy'
+    for path in glob.glob(pattern):
+        if path != base:
+            os.remove(path)
+    if meta is not None and 'base' not in meta and os.path.exists(filename):
+        os.remove(filename)
+    for number in delta_numbers(filename):
+        if number <= through:
+            os.remove(delta_filename(filename, number))
+
+
+def save_delta(filename, number, states, actions, values):
+    """Write the values changed since the previous delta (or the base) as delta number."""
+    path = delta_filename(filename, number)
+    with open(path + '.tmp', 'wb') as file:
+        np.savez(file, states=states, actions=actions, values=values)
+    os.replace(path + '.tmp', path)
+
+
+def open_checkpoint(filename, space_key, writable=False):
+    """A DenseQTable of a checkpoint written for the same space_key, deltas applied.
+
+    Read-only by default: the array is memory-mapped, so opening is near instant and every process
+    opening the same checkpoint shares one copy through the page cache. writable, or any deltas to
+    apply, loads a private copy instead."""
+    meta = checkpoint_meta(filename)
+    if meta is None:
+        raise FileNotFoundError(filename + " has no checkpoint sidecar")
+    if meta['version'] != CHECKPOINT_VERSION:
+        raise ValueError(filename + " is not a version " + str(CHECKPOINT_VERSION) + " checkpoint")
+    if meta['space'] != space_key:
+        raise ValueError(filename + " was written for a different state and action space")
+    numbers = [number for number in delta_numbers(filename) if number > meta.get('through', 0)]
+    table = np.load(checkpoint_base(filename, meta), mmap_mode=None if writable or numbers else 'r')
+    for number in numbers:
+        with np.load(delta_filename(filename, number)) as delta:
+            table[delta['states'], delta['actions']] = delta['values']
+    return DenseQTable(*table.shape, table=table)
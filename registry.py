@@ -0,0 +1,82 @@
+"""Registry of live troops keyed by stable integer handles."""
+
+# A handle packs a slot index in its low bits and that slot's generation above them
+SLOT_BITS = 24
+SLOT_MASK = (1 << SLOT_BITS) - 1
+
+
+class TroopRegistry:
+    """Both teams' live troops with O(1) insertion, removal and handle lookup.
+
+    Each troop gets a handle when added. Slots are recycled once a troop is removed, but every
+    removal bumps the slot's generation, so an old handle (say, a target that has since died)
+    resolves to None instead of to whatever troop reuses its slot. Each team's troops are kept
+    in placement order and can be iterated without copying."""
+    def __init__(self):
+        self.cards = []
+        self.generations = []
+        self.free = []
+        self.friendly = {}
+        self.evil = {}
+
+    def add(self, card):
+        """Register a card, set card.handle, and return the handle."""
+        if self.free:
+            slot = self.free.pop()
+            self.cards[slot] = card
+        else:
+            slot = len(self.cards)
+            self.cards.append(card)
+            self.generations.append(0)
+        handle = (self.generations[slot] << SLOT_BITS) | slot
+        card.handle = handle
+        if card.is_evil:
+            self.evil[handle] = card
+        else:
+            self.friendly[handle] = card
+        return handle
+
+    def remove(self, card):
+        """Unregister a card. Returns False if it was not live, e.g. already removed."""
+        handle = card.handle
+        if handle is None or self.get(handle) is not card:
+            return False
+        slot = handle & SLOT_MASK
+        if card.is_evil:
+            del self.evil[handle]
+        else:
+            del self.friendly[handle]
+        self.cards[slot] = None
+        self.generations[slot] += 1
+        self.free.append(slot)
+        return True
+
+    def clone(self, copy_card):
+        """A registry holding copy_card(card) for every live card, under the same handles."""
+        registry = TroopRegistry()
+        registry.cards = [None if card is None else copy_card(card) for card in self.cards]
+        registry.generations = list(self.generations)
+        registry.free = list(self.free)
+        registry.friendly = {handle: registry.cards[handle & SLOT_MASK] for handle in self.friendly}
+        registry.evil = {handle: registry.cards[handle & SLOT_MASK] for handle in self.evil}
+        return registry
+
+    def get(self, handle):
+        """The live card with this handle, or None if it has been removed."""
+        slot = handle & SLOT_MASK
+        if slot < len(self.cards) and self.generations[slot] == handle >> SLOT_BITS:
+            return self.cards[slot]
+        return None
+
+    def team(self, is_evil):
+        """A live view of one team's troops in placement order."""
+        if is_evil:
+            return self.evil.values()
+        return self.friendly.values()
+
+    def __len__(self):
+        return len(self.friendly) + len(self.evil)
+
+    def __iter__(self):
+        yield from self.friendly.values()
+        yield from self.evil.values()
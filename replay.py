@@ -0,0 +1,161 @@
+"""Compact binary episode replays: record a game's seed and actions, then replay it headlessly."""
+
+import argparse
+import struct
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from board import CARD_DEFINITIONS
+from simulation import BACKENDS, board_class_for, elixir_schedule, make_deck, process_action
+
+########## FORMAT ##########
+
+# A replay file is a sequence of episodes, each a fixed-size header followed by two uint16 action
+# codes (agent, adversary) per tick: magic, version, backend (index into simulation.BACKENDS), seed,
+# elixir interval, ticks, won, score, evil score.
+MAGIC = b'RGRP'
+VERSION = 1
+HEADER = struct.Struct('<4sBBQdIBBB')
+
+# An action code is the card's index (0 for None) above the index of its location in the card's
+# LegalDeployments
+CARDS = [None] + [name for name, definition in CARD_DEFINITIONS.items() if definition.LegalDeployments]
+CARD_CODES = {name: code for code, name in enumerate(CARDS)}
+LOCATION_CODES = {name: {location: code for code, location in enumerate(CARD_DEFINITIONS[name].LegalDeployments)}
+                  for name in CARDS[1:]}
+LOCATION_BITS = 10
+LOCATION_MASK = (1 << LOCATION_BITS) - 1
+
+Episode = namedtuple('Episode', ['seed', 'backend', 'elixir_interval', 'won', 'score', 'evil_score', 'actions'])
+Episode.__doc__ = """One recorded game; actions is a (ticks, 2) uint16 array of agent and adversary action codes."""
+
+
+def encode_action(action):
+    """Pack an agent action, (card name or None, location), into a small integer."""
+    card, location = action
+    if card is None:
+        return 0
+    return (CARD_CODES[card] << LOCATION_BITS) | LOCATION_CODES[card][location]
+
+
+def decode_action(code):
+    """The (card name or None, location) action an encoded action stands for."""
+    card = CARDS[code >> LOCATION_BITS]
+    if card is None:
+        return (None, (0, 0))
+    return (card, CARD_DEFINITIONS[card].LegalDeployments[code & LOCATION_MASK])
+
+
+########## RECORDING ##########
+
+class ReplayWriter:
+    """Appends finished episodes to a replay file, batch episodes per write."""
+    def __init__(self, filename, batch=64):
+        self.filename = filename
+        self.batch = batch
+        self.pending = []
+
+    def record(self, board, actions, elixir_interval):
+        """Add the game just finished on board, given both sides' (action, evil_action) per tick."""
+        backend = [board_class_for(name) for name in BACKENDS].index(type(board))
+        codes = np.array([(encode_action(action), encode_action(evil_action)) for action, evil_action in actions],
+                         dtype='<u2').reshape(-1, 2)
+        header = HEADER.pack(MAGIC, VERSION, backend, board.seed, elixir_interval, len(codes),
+                             board.won, board.score, board.evil_score)
+        self.pending.append(header + codes.tobytes())
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            with open(self.filename, "ab") as file:
+                file.write(b"".join(self.pending))
+            self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+def read_replays(filename):
+    """Every episode recorded in a replay file, in order."""
+    with open(filename, "rb") as file:
+        data = file.read()
+    episodes = []
+    offset = 0
+    while offset < len(data):
+        magic, version, backend, seed, elixir_interval, ticks, won, score, evil_score = HEADER.unpack_from(data, offset)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(filename + " is not a version " + str(VERSION) + " replay file")
+        offset += HEADER.size
+        actions = np.frombuffer(data, dtype='<u2', count=2 * ticks, offset=offset).reshape(ticks, 2)
+        offset += actions.nbytes
+        episodes.append(Episode(seed, BACKENDS[backend], elixir_interval, bool(won), score, evil_score, actions))
+    return episodes
+
+
+########## REPLAYING ##########
+
+def replay(episode, deck=None, log=None):
+    """Replay an episode on a fresh board, yielding (board, action, evil_action) before each tick's actions.
+
+    Only the board is stepped: no agent is consulted and nothing learns, so this runs far faster than
+    the original game. Once the generator is exhausted the board holds the final position. deck must
+    be in make_deck's order, as hand draws depend on it."""
+    if deck is None:
+        deck = make_deck(None)
+    board = board_class_for(episode.backend)(deck, log=log, seed=episode.seed)
+
+    # Elixir is paid out exactly as Simulation.step does
+    next_elixir = elixir_schedule(board, episode.elixir_interval)
+    for tick, (code, evil_code) in enumerate(episode.actions, 1):
+        while next_elixir <= tick:
+            board.increment_elixir()
+            next_elixir += episode.elixir_interval
+        board.update_state()
+        action, evil_action = decode_action(code), decode_action(evil_code)
+        yield board, action, evil_action
+        new_card = process_action(action, board)
+        if new_card:
+            board.place_troop(new_card)
+        new_card = process_action(evil_action, board, is_evil=True)
+        if new_card:
+            board.place_troop(new_card)
+
+    # The tick that ended the game
+    tick = len(episode.actions) + 1
+    while next_elixir <= tick:
+        board.increment_elixir()
+        next_elixir += episode.elixir_interval
+    board.update_state()
+
+
+def replay_episode(episode, deck=None, log=None):
+    """Replay an episode to the end and return its final board."""
+    for board, action, evil_action in replay(episode, deck, log):
+        pass
+    return board
+
+
+def main():
+    """Replay every episode in a replay file headlessly, checking each ends as recorded."""
+    parser = argparse.ArgumentParser(description="Replay recorded Royal Ghost episodes without a window.")
+    parser.add_argument("replays", help="replay file written by simulation.py --record")
+    args = parser.parse_args()
+
+    episodes = read_replays(args.replays)
+    deck = make_deck(None)
+    mismatches = 0
+    start = time.time()
+    for episode in episodes:
+        final = replay_episode(episode, deck)
+        if (final.won, final.score, final.evil_score) != (episode.won, episode.score, episode.evil_score):
+            mismatches += 1
+    elapsed = time.time() - start
+    print("Replayed", len(episodes), "episodes in", round(elapsed, 2), "s (",
+          round(len(episodes) / max(elapsed, 1e-9), 2), "episodes/s ),", mismatches, "ended differently than recorded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Discrete-event board: units act when they fall due on a heap instead of all once per tick."""
+
+import heapq
+
+from board import GameBoard
+from events import TURN
+
+# Event kinds; events due at the same time run in this order, then in the order they were scheduled
+ELIXIR, UNIT = 0, 1
+
+
+class ScheduledBoard(GameBoard):
+    """A GameBoard whose units, towers and elixir act when they fall due on a heap of events, so fast
+    units step several times a tick and towers with nothing in range sleep until an enemy comes near."""
+    def __init__(self, deck=None, log=None, seed=None):
+        self.queue = []
+        self.sequence = 0
+        # Current game time in ticks; whole numbers at tick boundaries
+        self.clock = 0
+        self.elixir_interval = None
+        # Handles of towers waiting for an enemy to come within range
+        self.asleep = set()
+        super().__init__(deck, log, seed)
+
+    def push(self, time, kind, handle=None):
+        self.sequence += 1
+        heapq.heappush(self.queue, (time, kind, self.sequence, handle))
+
+    def schedule_elixir(self, interval):
+        """Pay out elixir every interval ticks from the event heap."""
+        self.elixir_interval = interval
+        self.push(self.clock + interval, ELIXIR)
+
+    def add_troop(self, card):
+        super().add_troop(card)
+        # New cards act on the next tick, or sooner if they are fast
+        self.push(self.clock + (1 / card.speed if card.speed else 1), UNIT, card.handle)
+        if self.asleep:
+            self.wake_towers(card)
+
+    def relocate(self, card, location):
+        super().relocate(card, location)
+        if self.asleep:
+            self.wake_towers(card)
+
+    def wake_towers(self, card):
+        """Put any sleeping enemy tower that card is now within range of back on the heap."""
+        x, y = card.location
+        for handle in list(self.asleep):
+            tower = self.registry.get(handle)
+            if tower is None:
+                self.asleep.discard(handle)
+            elif tower.is_evil != card.is_evil:
+                reach = tower.range + 1
+                if (x - tower.location[0]) ** 2 + (y - tower.location[1]) ** 2 < reach * reach:
+                    self.asleep.discard(handle)
+                    self.push(self.clock, UNIT, handle)
+
+    def update_state(self, dt = None):
+        """Advance one tick: the usual bookkeeping, then every event due before the tick ends."""
+        if self.log.debug:
+            self.log.emit(TURN, self.turn)
+        if self.assess_game_over():
+            return
+        self.sweep_dead()
+        self.time -= 1
+        self.troop_damage = 0
+        self.evil_troop_damage = 0
+        self.run_until(self.clock + 1)
+
+    def run_until(self, end):
+        """Run every event due at or before time end, in time order."""
+        queue = self.queue
+        while queue and queue[0][0] <= end:
+            time, kind, _, handle = heapq.heappop(queue)
+            self.clock = time
+            if kind == ELIXIR:
+                self.increment_elixir()
+                self.push(time + self.elixir_interval, ELIXIR)
+                continue
+            card = self.registry.get(handle)
+            if card is None:
+                continue
+            delay = card.action()
+            if delay is not None:
+                self.push(time + delay, UNIT, handle)
+            elif card.is_building:
+                self.asleep.add(handle)
+        self.clock = end
+
+    def clone(self, log=None, seed=None):
+        """An independent copy of the game in progress; see GameBoard.clone. Events refer to handles,
+        which the copy shares, so the heap is copied as is."""
+        board = super().clone(log, seed)
+        board.queue = list(self.queue)
+        board.asleep = set(self.asleep)
+        return board
+
@@ -0,0 +1,270 @@
+"""Headless game loop: steps a GameBoard and two agents as fast as the CPU allows."""
+
+import argparse
+import time
+
+from board import *
+from events import EventLog, BatchedFileSink, DEPLOY
+
+
+# Board backends selectable by name
+BACKENDS = ('objects', 'arrays', 'scheduled')
+
+
+def board_class_for(backend):
+    """The board class behind a backend name."""
+    if backend == 'arrays':
+        from array_board import ArrayBoard
+        return ArrayBoard
+    if backend == 'scheduled':
+        from scheduler import ScheduledBoard
+        return ScheduledBoard
+    return GameBoard
+
+
+def elixir_schedule(board, interval):
+    """The tick a fresh board is first paid elixir on by the tick loop: interval, or never if the board
+    pays out elixir from its own event queue (scheduler.ScheduledBoard)."""
+    if hasattr(board, 'schedule_elixir'):
+        board.schedule_elixir(interval)
+        return float('inf')
+    return interval
+
+
+def make_deck(board):
+    """The eight-card deck both sides play with."""
+    return [Barbarians((0,0), board), Zap((0,0), board), MiniPekka((0,0), board), HogRider((0,0), board),
+            Archers((0,0), board), Bomber((0,0), board), BabyDragon((0,0), board), Goblins((0,0), board)]
+
+
+def invert_location(location):
+    x,y = location
+    new_y = 30 - y
+    return (x, new_y)
+
+
+def process_action(action, board, is_evil=False):
+    """A function to take an agent's action and turn it into troop generation."""
+    card, location = action
+    if is_evil:
+        location = invert_location(location)
+    if card is None:
+        return
+    return CARD_TYPES[card](location, board, is_evil=is_evil)
+
+
+def nearest_troop_agent_state(board, is_evil):
+    """Get state for a nearest troop agent as (nearest_card.name, nearest_card.location, elixir_count)"""
+    if not is_evil:
+        troops = [troop for troop in board.live_evil_troops if troop.target]
+        elixir = board.elixir_count
+    else:
+        troops = [troop for troop in board.live_troops if troop.target]
+        elixir = board.evil_elixir_count
+    # If there exists a troop on the board targeting agent:
+    if troops:
+        closest_troop = min(troops, key=lambda troop: troop.target_distance())
+        return (closest_troop.name, int(closest_troop.target_distance()), elixir)
+    # Else, consider no troops.
+    else:
+        return (None, 0, elixir)
+
+
+class Simulation:
+    """Owns a GameBoard and both agents, and advances them one tick at a time.
+
+    step() runs increment_elixir, update_state and both agent dispatches back-to-back, so the
+    game runs at CPU speed with no window; a view.BoardView may be attached to self.board to watch."""
+    def __init__(self, deck, agent, evil_agent, board=None, learn=True, verbose_mode=None, elixir_interval=2.8,
+                 board_class=GameBoard, log=None, recorder=None):
+        self.deck = deck
+        # GameBoard, a drop-in backend such as scheduler.ScheduledBoard, or array_board.ArrayBoard's
+        # simultaneous-move ruleset
+        self.board_class = board_class
+        self.agent = agent
+        self.evil_agent = evil_agent
+        self.learn = learn
+        # One event log for every episode's board; verbose_mode, if given, overrides its level
+        self.log = log if log is not None else EventLog()
+        if verbose_mode is not None:
+            self.verbose_mode = verbose_mode
+        # Elixir ticks once every elixir_interval board ticks, as the 2.8x pyglet timer did
+        self.elixir_interval = elixir_interval
+        self.use_counts = {card.name: 0 for card in deck}
+        # Optional replay.ReplayWriter that every episode played through step() is appended to
+        self.recorder = recorder
+        self.reset(board)
+
+    def reset(self, board=None, seed=None):
+        """Start a new episode on a fresh board (but keep both agents)."""
+        if board is None:
+            board = self.board_class(self.deck, log=self.log, seed=seed)
+        self.board = board
+        self.agent.board = board
+        self.evil_agent.board = board
+        self.ticks = 0
+        self.next_elixir = elixir_schedule(board, self.elixir_interval)
+        # Both sides' actions each tick, for the recorder
+        self.actions = []
+        return board
+
+    @property
+    def verbose_mode(self):
+        return self.log.verbose
+
+    @verbose_mode.setter
+    def verbose_mode(self, verbose):
+        self.log.verbose = verbose
+
+    def dispatch_agent(self, dt=None):
+        """Let the agent act, then update its Q-values from the last transition."""
+        board = self.board
+        state = nearest_troop_agent_state(board, False)
+        action = self.agent.getAction(state)
+        new_card = process_action(action, board)
+        if self.log.info:
+            self.log.emit(DEPLOY, board.turn, action[0], None, 0, False)
+        if new_card:
+            self.use_counts[new_card.name] += 1
+            board.place_troop(new_card)
+
+        # Update the Q-values of the agent based on the results of its last action, now that the following state is known
+        if self.learn and board.last_state and board.last_action:
+            self.agent.update(board.last_state, board.last_action, state, board.last_payout)
+        board.last_state = state
+        board.last_action = action
+        board.last_payout = board.action_payout()
+        return action
+
+    def dispatch_evil_agent(self, dt=None):
+        """Call the evil agent to make a move. DO NOT update agent."""
+        board = self.board
+        state = nearest_troop_agent_state(board, True)
+        action = self.evil_agent.getAction(state)
+        new_card = process_action(action, board, is_evil=True)
+        if self.log.info:
+            self.log.emit(DEPLOY, board.turn, action[0], None, 0, True)
+        if new_card:
+            board.place_troop(new_card)
+        return action
+
+    def step(self, dt=None):
+        """Advance one tick. Returns False once the game is over."""
+        board = self.board
+        self.ticks += 1
+        while self.next_elixir <= self.ticks:
+            board.increment_elixir()
+            self.next_elixir += self.elixir_interval
+        board.update_state()
+        if board.game_over:
+            if self.recorder is not None and self.actions is not None:
+                self.recorder.record(board, self.actions, self.elixir_interval)
+                self.actions = None
+            return False
+        action = self.dispatch_agent()
+        evil_action = self.dispatch_evil_agent()
+        if self.recorder is not None:
+            self.actions.append((action, evil_action))
+        return True
+
+    def run_episode(self):
+        """Play the current board to completion and report whether the agent won."""
+        while self.step():
+            pass
+        return self.board.won
+
+
+def main():
+    """Train headlessly: no window, no display, no pyglet."""
+    from clash_agents import NearestTroopAgent, RolloutAgent, TileCodedAgent
+
+    parser = argparse.ArgumentParser(description="Run Royal Ghost episodes without a window.")
+    parser.add_argument("--episodes", type=int, default=50)
+    parser.add_argument("--load", default="", help="parquet file or .npy checkpoint to load Q values from")
+    parser.add_argument("--out", default="", help="parquet file or .npy checkpoint to save Q values to (default: same as --load)")
+    parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--agent", choices=["nearest", "tiles", "rollout"], default="nearest",
+                        help="the Q-learning NearestTroopAgent, TileCodedAgent learning a linear function of "
+                             "tile-coded features (its adversary too), or RolloutAgent searching ahead on board clones")
+    parser.add_argument("--budget", type=float, default=0.05, help="seconds RolloutAgent may search per decision")
+    parser.add_argument("--event-log", default="", help="append every game event to this file instead of printing")
+    parser.add_argument("--record", default="", help="append a binary replay of every episode to this file")
+    parser.add_argument("--checkpoint-every", type=int, default=0,
+                        help="every this many episodes, save the Q values changed since the last time to the "
+                             ".npy checkpoint beside --out, in the background (0: off)")
+    parser.add_argument("--replay", type=int, default=0,
+                        help="learn from batches sampled from a buffer of this many transitions, instead of each one as it happens")
+    parser.add_argument("--prioritized", action="store_true", help="sample --replay batches by TD error")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--update-every", type=int, default=4, help="transitions between --replay batch updates")
+    parser.add_argument("--sparse", action="store_true",
+                        help="keep Q values in a sparse table that only stores what has been visited")
+    parser.add_argument("--backend", choices=BACKENDS, default="objects",
+                        help="one GameCard object per unit, scheduler's event-driven board where unit speed "
+                             "counts, or array_board's vectorized board, a different ruleset where every "
+                             "unit moves at once (games do not end as on the objects backend)")
+    args = parser.parse_args()
+
+    board = GameBoard()
+    deck = make_deck(board)
+    if args.agent == "rollout":
+        agent = RolloutAgent(deck, deck, board, time_budget=args.budget)
+    elif args.agent == "tiles":
+        agent = TileCodedAgent(deck, deck, board)
+    else:
+        replay = None
+        if args.replay:
+            from experience import ReplayBuffer
+            replay = ReplayBuffer(args.replay, prioritized=args.prioritized)
+        agent = NearestTroopAgent(deck, deck, board, sparse=args.sparse, replay=replay,
+                                  batch_size=args.batch_size, update_every=args.update_every)
+    if args.agent == "tiles":
+        evil_agent = TileCodedAgent(deck, deck, board)
+    else:
+        evil_agent = NearestTroopAgent(deck, deck, board, sparse=args.sparse)
+    evil_agent.is_evil = True
+    if args.load:
+        if args.agent != "rollout":
+            agent.load(args.load)
+        evil_agent.load(args.load, frozen=True)
+
+    board_class = board_class_for(args.backend)
+    log = EventLog()
+    if args.event_log:
+        log = EventLog(sinks=[BatchedFileSink(args.event_log)])
+    recorder = None
+    if args.record:
+        from replay import ReplayWriter
+        recorder = ReplayWriter(args.record)
+    sim = Simulation(deck, agent, evil_agent, verbose_mode=args.verbose or bool(args.event_log),
+                     board_class=board_class, log=log, recorder=recorder)
+    out = args.out or args.load
+    checkpointer = None
+    if args.checkpoint_every and out and args.agent != "rollout":
+        from checkpoint import Checkpointer, checkpoint_name
+        checkpointer = Checkpointer(agent, checkpoint_name(out), every=args.checkpoint_every)
+    wins = 0
+    start = time.time()
+    for episode in range(args.episodes):
+        sim.reset()
+        wins += sim.run_episode()
+        if checkpointer is not None:
+            checkpointer.episode_done()
+    elapsed = time.time() - start
+    if checkpointer is not None:
+        checkpointer.close()
+    log.flush()
+    if recorder is not None:
+        recorder.close()
+    print("Played", args.episodes, "episodes in", round(elapsed, 2), "s (",
+          round(args.episodes / max(elapsed, 1e-9), 2), "episodes/s ), win rate",
+          round(100 * wins / max(args.episodes, 1), 2), "%")
+    if args.agent == "rollout":
+        print("RolloutAgent searched", agent.rollouts, "rollouts at", round(agent.rollouts_per_second, 1), "rollouts/s")
+
+    if out and args.agent != "rollout":
+        agent.save(out)
+
+
+if __name__ == "__main__":
+    main()
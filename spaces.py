@@ -0,0 +1,140 @@
+"""State and action spaces for the learning agents, built once per deck and board layout and shared."""
+
+import hashlib
+
+import numpy as np
+
+# A state is (nearest enemy card, distance to tower, elixir): distances are 0..MAX_DISTANCE - 1
+MAX_DISTANCE = 36
+MAX_ELIXIR = 10
+# Nearest "cards" besides the enemy deck
+EXTRA_STATE_CARDS = ('princess tower', 'king tower')
+
+# One AgentSpace per distinct (deck, enemy deck, board layout), shared by every agent built on it
+_SPACES = {}
+
+
+def agent_space(deck, enemydeck, board):
+    """The process-wide AgentSpace for these decks on a board of this size."""
+    key = (tuple((card.name, card.cost, tuple(card.LegalDeployments)) for card in deck),
+           tuple(card.name for card in enemydeck), board.width, board.height)
+    space = _SPACES.get(key)
+    if space is None:
+        space = _SPACES[key] = AgentSpace(deck, enemydeck, board.width, board.height)
+    return space
+
+
+class AgentSpace:
+    """Every state and action a NearestTroopAgent can see, with index maps and legality tables.
+
+    states is a tuple of (card name, distance, elixir), card None for no troop in range, and actions
+    a tuple of (card name, (x, y)) with None, (0, 0) first and each deck card's placements a
+    contiguous run, action_ranges[name] = (start, stop). Everything here is shared between agents,
+    so none of it may be modified: the index maps are plain dicts for speed, the arrays read-only."""
+    def __init__(self, deck, enemydeck, width, height):
+        self.width = width
+        self.height = height
+        self.locations = tuple((x, y) for x in range(width) for y in range(height))
+        self.card_costs = {card.name: card.cost for card in deck}
+        self.card_bits = {card.name: 1 << position for position, card in enumerate(deck)}
+
+        actions = [(None, (0, 0))]
+        self.action_ranges = {}
+        for card in deck:
+            start = len(actions)
+            actions.extend((card.name, location) for location in card.LegalDeployments)
+            self.action_ranges[card.name] = (start, len(actions))
+        self.actions = tuple(actions)
+        self.action_indices = {action: index for index, action in enumerate(self.actions)}
+
+        cards = [card.name for card in enemydeck] + list(EXTRA_STATE_CARDS)
+        states = [(name, distance, elixir) for name in cards
+                  for distance in range(MAX_DISTANCE) for elixir in range(MAX_ELIXIR + 1)]
+        states.extend((None, 0, elixir) for elixir in range(MAX_ELIXIR + 1))
+        self.states = tuple(states)
+        self.state_indices = {state: index for index, state in enumerate(self.states)}
+
+        # Fingerprint for checkpoints, so one only opens on a matching space
+        self.key = hashlib.md5(repr((list(self.states), list(self.actions))).encode()).hexdigest()
+
+        # {(sorted hand names, elixir, side): (mask, indices)}, see legal_actions
+        self.legal_cache = {}
+        # {key: id} and the masks by id, see legal_id
+        self.legal_ids = {}
+        self.legal_stack = None
+        # See qvals_columns
+        self.columns = None
+
+    def legal_actions(self, key):
+        """(mask, indices) of the legal actions for a legal key, (sorted hand names, elixir, side).
+
+        mask is a read-only boolean array over actions and indices its ascending True columns, so
+        None (0) comes first. Each is built once and cached."""
+        legal = self.legal_cache.get(key)
+        if legal is None:
+            names, elixir, is_evil = key
+            mask = np.zeros(len(self.actions), dtype=bool)
+            mask[0] = True
+            for name in names:
+                if self.card_costs[name] <= elixir:
+                    mask[slice(*self.action_ranges[name])] = True
+            indices = np.flatnonzero(mask)
+            mask.setflags(write=False)
+            indices.setflags(write=False)
+            legal = self.legal_cache[key] = (mask, indices)
+        return legal
+
+    def legal_id(self, key):
+        """A small integer standing for a legal key's mask, for storing many of them compactly.
+
+        It is the set of playable deck cards as bits in deck order, so the same in every process."""
+        legal_id = self.legal_ids.get(key)
+        if legal_id is None:
+            names, elixir, is_evil = key
+            legal_id = self.legal_ids[key] = sum(self.card_bits[name] for name in set(names)
+                                                 if self.card_costs[name] <= elixir)
+        return legal_id
+
+    def legal_masks(self):
+        """Read-only boolean [legal id, action] array of every legal id's mask, built on first use."""
+        if self.legal_stack is None:
+            masks = np.zeros((1 << len(self.card_bits), len(self.actions)), dtype=bool)
+            masks[:, 0] = True
+            for name, bit in self.card_bits.items():
+                start, stop = self.action_ranges[name]
+                masks[(np.arange(len(masks)) & bit) != 0, start:stop] = True
+            masks.setflags(write=False)
+            self.legal_stack = masks
+        return self.legal_stack
+
+    def qvals_columns(self):
+        """Per-row and per-column arrays for reading and writing Q-value files, built on first use.
+
+        card_names is the file's card dictionary; state and action components are indexed by row and
+        column, with -1 codes for None cards. state_grid[card + 1, distance, elixir] and
+        action_grid[card + 1, x, y] map them back, -1 where the combination isn't in the space."""
+        if self.columns is None:
+            names = sorted({name for name, _, _ in self.states if name is not None}
+                           | {name for name, _ in self.actions if name is not None})
+            codes = {name: code for code, name in enumerate(names)}
+            codes[None] = -1
+            state_cards = np.array([codes[name] for name, _, _ in self.states], dtype=np.int8)
+            distances = np.array([distance for _, distance, _ in self.states], dtype=np.int8)
+            elixirs = np.array([elixir for _, _, elixir in self.states], dtype=np.int8)
+            action_cards = np.array([codes[name] for name, _ in self.actions], dtype=np.int8)
+            xs = np.array([x for _, (x, y) in self.actions], dtype=np.int8)
+            ys = np.array([y for _, (x, y) in self.actions], dtype=np.int8)
+
+            state_grid = np.full((len(names) + 1, distances.max() + 1, elixirs.max() + 1), -1, dtype=np.int64)
+            state_grid[state_cards + 1, distances, elixirs] = np.arange(len(self.states))
+            action_grid = np.full((len(names) + 1, xs.max() + 1, ys.max() + 1), -1, dtype=np.int64)
+            action_grid[action_cards + 1, xs, ys] = np.arange(len(self.actions))
+            columns = {'state_card': state_cards, 'distance': distances, 'elixir': elixirs,
+                       'action_card': action_cards, 'action_x': xs, 'action_y': ys,
+                       'state_grid': state_grid, 'action_grid': action_grid}
+            for array in columns.values():
+                array.setflags(write=False)
+            columns['card_names'] = names
+            columns['card_codes'] = codes
+            self.columns = columns
+        return self.columns
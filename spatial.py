@@ -0,0 +1,109 @@
+"""Bucketed spatial index for nearest-target queries on the 18x30 board."""
+
+
+class BucketGrid:
+    """Cards hashed into bucket x bucket tile cells, searched ring by ring outward from a query.
+
+    Cards whose location is off the board are kept in a small overflow set and always checked.
+    Ties on distance go to the card with the lowest card.order, i.e. the one added to the board first,
+    which is the card min() would have picked from the live troop list."""
+    def __init__(self, width, height, bucket=3):
+        self.width = width
+        self.height = height
+        self.bucket = bucket
+        self.cols = (width + bucket - 1) // bucket
+        self.rows = (height + bucket - 1) // bucket
+        self.cells = [[set() for _ in range(self.cols)] for _ in range(self.rows)]
+        self.overflow = set()
+        self.size = 0
+
+    def cell(self, location):
+        """The set a card at location is filed under."""
+        x, y = location
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y // self.bucket][x // self.bucket]
+        return self.overflow
+
+    def add(self, card):
+        self.cell(card.location).add(card)
+        self.size += 1
+
+    def remove(self, card):
+        self.cell(card.location).discard(card)
+        self.size -= 1
+
+    def move(self, card, old_location):
+        """Refile a card that has moved from old_location to card.location."""
+        old_cell = self.cell(old_location)
+        new_cell = self.cell(card.location)
+        if old_cell is not new_cell:
+            old_cell.discard(card)
+            new_cell.add(card)
+
+    def nearest(self, location):
+        """The card nearest to location, or None if the grid is empty."""
+        if not self.size:
+            return None
+        x, y = location
+        best = None
+        best_dist = 0
+        best_order = 0
+        for cand in self.overflow:
+            dist = (x - cand.location[0]) ** 2 + (y - cand.location[1]) ** 2
+            if best is None or dist < best_dist or (dist == best_dist and cand.order < best_order):
+                best, best_dist, best_order = cand, dist, cand.order
+
+        # Search from the query projected onto the board; that never overestimates a distance to a card on it
+        qx = min(max(x, 0), self.width - 1) // self.bucket
+        qy = min(max(y, 0), self.height - 1) // self.bucket
+        for ring in range(max(self.rows, self.cols)):
+            # Every tile in this ring is at least (ring - 1) * bucket + 1 tiles away along some axis
+            if best is not None and ring > 0 and ((ring - 1) * self.bucket + 1) ** 2 > best_dist:
+                break
+            for row in range(max(qy - ring, 0), min(qy + ring, self.rows - 1) + 1):
+                on_edge = row == qy - ring or row == qy + ring
+                step = 1 if on_edge else 2 * ring
+                for col in range(qx - ring, qx + ring + 1, step):
+                    if col < 0 or col >= self.cols:
+                        continue
+                    for cand in self.cells[row][col]:
+                        dist = (x - cand.location[0]) ** 2 + (y - cand.location[1]) ** 2
+                        if best is None or dist < best_dist or (dist == best_dist and cand.order < best_order):
+                            best, best_dist, best_order = cand, dist, cand.order
+        return best
+
+
+class TargetIndex:
+    """One team's troops, partitioned by the target policies that can see them.
+
+    'all' holds every troop, 'ground' every troop that is not flying and 'buildings' only buildings,
+    so GameBoard.target can ask the right grid instead of filtering the whole team."""
+    def __init__(self, width, height):
+        self.grids = {'all': BucketGrid(width, height),
+                      'ground': BucketGrid(width, height),
+                      'buildings': BucketGrid(width, height)}
+
+    def grids_for(self, card):
+        grids = [self.grids['all']]
+        if not card.is_flying:
+            grids.append(self.grids['ground'])
+        if card.is_building:
+            grids.append(self.grids['buildings'])
+        return grids
+
+    def add(self, card):
+        for grid in self.grids_for(card):
+            grid.add(card)
+
+    def remove(self, card):
+        for grid in self.grids_for(card):
+            grid.remove(card)
+
+    def move(self, card, old_location):
+        for grid in self.grids_for(card):
+            grid.move(card, old_location)
+
+    def nearest(self, location, target_policy):
+        """Nearest troop visible to target_policy; any policy but 'buildings' or 'ground' sees all."""
+        grid = self.grids.get(target_policy, self.grids['all'])
+        return grid.nearest(location)
@@ -0,0 +1,199 @@
+"""Parallel training: actor processes play headless episodes and stream transitions to one learner."""
+
+import argparse
+import multiprocessing as mp
+import queue
+import random
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from board import GameBoard
+from clash_agents import NearestTroopAgent
+from experience import ReplayBuffer
+from qtable import DenseQTable
+from simulation import BACKENDS, Simulation, board_class_for, make_deck
+
+
+class TransitionBatch:
+    """Stands in for an actor agent's ReplayBuffer, collecting its transitions to send on."""
+    def __init__(self):
+        self.transitions = []
+
+    def __len__(self):
+        return len(self.transitions)
+
+    def add(self, state, action, reward, next_state, next_legal):
+        self.transitions.append((state, action, reward, next_state, next_legal))
+
+    def take(self):
+        """The transitions collected so far as (states, actions, rewards, next states, next legal) arrays."""
+        transitions, self.transitions = self.transitions, []
+        if not transitions:
+            return None
+        states, actions, rewards, next_states, next_legal = zip(*transitions)
+        return (np.array(states, dtype=np.int32), np.array(actions, dtype=np.int32),
+                np.array(rewards, dtype=np.float32), np.array(next_states, dtype=np.int32),
+                np.array(next_legal, dtype=np.int32))
+
+
+def actor(worker, episodes, snapshot_name, shape, transitions, options):
+    """Play episodes with the learner's latest published Q-values, sending each one's transitions.
+
+    Every message is (worker, batch, episodes played, transitions sent, seconds since starting);
+    batch is None in the last one."""
+    random.seed(options.seed + worker)
+    np.random.seed(options.seed + worker)
+    # Actors share the learner's resource tracker, which unlinks the block only once the learner does
+    snapshot = shared_memory.SharedMemory(name=snapshot_name)
+    board = GameBoard()
+    deck = make_deck(board)
+    outbox = TransitionBatch()
+    agent = NearestTroopAgent(deck, deck, board, epsilon=options.epsilon, replay=outbox, update_every=0)
+    # Read-only view of the snapshot: the learner copies new values in while we play
+    table = np.ndarray(shape, dtype=np.float32, buffer=snapshot.buf)
+    table.flags.writeable = False
+    agent.qvalues = DenseQTable(*shape, table=table)
+    evil_agent = NearestTroopAgent(deck, deck, board)
+    evil_agent.is_evil = True
+    if options.load:
+        evil_agent.load(options.load, frozen=True)
+    sim = Simulation(deck, agent, evil_agent, board_class=board_class_for(options.backend))
+
+    sent = 0
+    start = time.time()
+    for episode in range(episodes):
+        sim.reset(seed=(options.seed + worker) * 1000003 + episode)
+        sim.run_episode()
+        batch = outbox.take()
+        if batch is not None:
+            sent += len(batch[0])
+        transitions.put((worker, batch, episode + 1, sent, time.time() - start))
+    transitions.put((worker, None, episodes, sent, time.time() - start))
+    del sim, agent, table
+    snapshot.close()
+
+
+class Learner:
+    """Learns from every actor's transitions and publishes its Q-values to them through shared memory."""
+    def __init__(self, options):
+        self.options = options
+        board = GameBoard()
+        deck = make_deck(board)
+        self.replay = ReplayBuffer(options.replay, prioritized=options.prioritized, seed=options.seed)
+        self.agent = NearestTroopAgent(deck, deck, board, replay=self.replay, batch_size=options.batch_size,
+                                       update_every=options.update_every)
+        if options.load:
+            self.agent.load(options.load)
+        table = self.agent.qvalues.to_array()
+        self.snapshot = shared_memory.SharedMemory(create=True, size=table.nbytes)
+        self.published = np.ndarray(table.shape, dtype=np.float32, buffer=self.snapshot.buf)
+        self.publish()
+        # Transitions received but not yet learned from, in units of update_every
+        self.pending = 0
+
+    def publish(self):
+        np.copyto(self.published, self.agent.qvalues.to_array())
+        self.last_publish = time.time()
+
+    def learn(self, batch):
+        self.replay.add_many(*batch)
+        self.pending += len(batch[0])
+        while self.agent.update_every and self.pending >= self.agent.update_every and len(self.replay) >= self.agent.batch_size:
+            self.agent.learn_batch()
+            self.pending -= self.agent.update_every
+        if time.time() - self.last_publish >= self.options.publish_interval:
+            self.publish()
+
+    def close(self):
+        del self.published
+        self.snapshot.close()
+        self.snapshot.unlink()
+
+
+def train(options):
+    """Run options.episodes episodes split over options.workers actors; returns the learner and per-worker stats."""
+    learner = Learner(options)
+    shape = learner.agent.qvalues.shape
+    transitions = mp.Queue(maxsize=options.queue_size)
+    shares = [options.episodes // options.workers + (worker < options.episodes % options.workers)
+              for worker in range(options.workers)]
+    actors = [mp.Process(target=actor, args=(worker, shares[worker], learner.snapshot.name, shape, transitions, options),
+                         daemon=True)
+              for worker in range(options.workers)]
+    for process in actors:
+        process.start()
+
+    # worker: (episodes, transitions, seconds)
+    stats = {worker: (0, 0, 0.0) for worker in range(options.workers)}
+    running = options.workers
+    last_report = time.time()
+    try:
+        while running:
+            try:
+                worker, batch, episodes, sent, elapsed = transitions.get(timeout=1.0)
+            except queue.Empty:
+                if not any(process.is_alive() for process in actors):
+                    raise RuntimeError("every actor exited before finishing its episodes")
+                continue
+            stats[worker] = (episodes, sent, elapsed)
+            if batch is None:
+                running -= 1
+            else:
+                learner.learn(batch)
+            if options.report_interval and time.time() - last_report >= options.report_interval:
+                report(stats)
+                last_report = time.time()
+        for process in actors:
+            process.join()
+        learner.publish()
+    finally:
+        learner.close()
+    return learner, stats
+
+
+def report(stats):
+    for worker, (episodes, sent, elapsed) in sorted(stats.items()):
+        elapsed = max(elapsed, 1e-9)
+        print("worker", worker, ":", episodes, "episodes,", round(episodes / elapsed, 2), "episodes/s,",
+              round(sent / elapsed, 1), "transitions/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train NearestTroopAgent with parallel actor processes and one learner.")
+    parser.add_argument("--workers", type=int, default=max(1, mp.cpu_count() - 1))
+    parser.add_argument("--episodes", type=int, default=200, help="in all, split between the workers")
+    parser.add_argument("--load", default="", help="parquet file or .npy checkpoint to start from (the adversary plays it)")
+    parser.add_argument("--out", default="", help="parquet file or .npy checkpoint to save Q values to (default: same as --load)")
+    parser.add_argument("--backend", choices=BACKENDS, default="objects",
+                        help="as for simulation.py; arrays is a different, simultaneous-move ruleset")
+    parser.add_argument("--epsilon", type=float, default=0.2, help="actors' exploration probability")
+    parser.add_argument("--replay", type=int, default=200000, help="transitions the learner keeps to sample from")
+    parser.add_argument("--prioritized", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--update-every", type=int, default=4, help="transitions received per batch update")
+    parser.add_argument("--publish-interval", type=float, default=1.0, help="seconds between Q snapshots sent to actors")
+    parser.add_argument("--queue-size", type=int, default=256, help="episodes in flight before actors wait for the learner")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="seconds between progress reports (0: off)")
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args()
+    if options.update_every < 1:
+        parser.error("--update-every must be at least 1")
+
+    start = time.time()
+    learner, stats = train(options)
+    elapsed = time.time() - start
+    report(stats)
+    episodes = sum(episodes for episodes, _, _ in stats.values())
+    sent = sum(sent for _, sent, _ in stats.values())
+    print("Played", episodes, "episodes in", round(elapsed, 2), "s (", round(episodes / max(elapsed, 1e-9), 2),
+          "episodes/s,", round(sent / max(elapsed, 1e-9), 1), "transitions/s ) with", options.workers, "workers")
+
+    out = options.out or options.load
+    if out:
+        learner.agent.save(out)
+
+
+if __name__ == "__main__":
+    main()
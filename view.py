@@ -0,0 +1,325 @@
+"""Optional pyglet view that renders an attached GameBoard."""
+
+import os
+
+import pyglet as pg
+
+IMAGE_DIR = "images"
+
+# Image files for the board's tiles and elixir bar, and for each card's portrait, by name
+TILE_IMAGES = {'legal': "greensquare.png", 'illegal': "redsquare.jpeg", 'elixir': "elixir_bar.jpeg"}
+CARD_IMAGES = {'barbarians': "barbarians.png", 'zap': "zap.png", 'mini pekka': "mini_pekka.png",
+               'hog rider': "hog_rider.png", 'goblins': "goblins.png", 'bomber': "bomber.png",
+               'archers': "archers.png", 'baby dragon': "baby dragon.png"}
+
+# Process-wide caches, filled on first use: textures by name, and sprites by tile size
+_textures = {}
+_sprites = {}
+
+
+def textures():
+    """Every image the view uses, decoded and uploaded once per process into a shared texture atlas."""
+    if not _textures:
+        atlas = pg.image.atlas.TextureBin()
+        for name, filename in list(TILE_IMAGES.items()) + list(CARD_IMAGES.items()):
+            _textures[name] = atlas.add(pg.image.load(os.path.join(IMAGE_DIR, filename)))
+    return _textures
+
+
+def card_sprites(tile_size):
+    """Sprites for every tile, the elixir bar and every card, scaled to tile_size and shared by all views."""
+    sprites = _sprites.get(tile_size)
+    if sprites is not None:
+        return sprites
+    sprites = _sprites[tile_size] = {}
+    for name, texture in textures().items():
+        sprite = pg.sprite.Sprite(texture)
+        if name in CARD_IMAGES:
+            sprite.scale_x = 1.5 * tile_size / texture.width
+            sprite.scale_y = 1.5 * (105 * tile_size) / (128 * texture.height)
+        elif name == 'elixir':
+            sprite.scale_x = 1.5 * tile_size / texture.width
+            sprite.scale_y = tile_size / texture.height
+        else:
+            sprite.scale_x = tile_size / texture.width
+            sprite.scale_y = (105 * tile_size) / (128 * texture.height)
+            sprite.opacity = 128
+        sprites[name] = sprite
+    return sprites
+
+
+class TroopGraphics:
+    """The pooled sprite and health labels drawn for one live troop."""
+    def __init__(self, name, sprite, health_label):
+        self.name = name
+        self.sprite = sprite
+        self.health_label = health_label
+        # Full-health labels stacked above for each further unit (barbarians, goblins, archers)
+        self.unit_labels = []
+        self.location = None
+
+
+class BoardView:
+    """Graphics for a GameBoard, kept in one pyglet Batch and drawn with a single call per frame.
+
+    The view holds no game state of its own; attach() points it at a new board between episodes.
+    Images are loaded once per process (see textures), so building another view, or another
+    board, never touches the disk again. Labels persist between frames and only change when their
+    text does, and each live troop borrows a sprite and labels from a pool that it returns them to
+    when it leaves the board, so a frame costs the same however many troops have come and gone."""
+    def __init__(self, tile_size, board=None):
+        """Take this tile size's shared sprites and attach to board, if given."""
+        self.sprites = card_sprites(tile_size)
+        self.green_square = self.sprites['legal']
+        self.red_square = self.sprites['illegal']
+        self.elixir_bar = self.sprites['elixir']
+
+        self.batch = pg.graphics.Batch()
+        self.tile_group = pg.graphics.Group(order=0)
+        self.sprite_group = pg.graphics.Group(order=1)
+        self.label_group = pg.graphics.Group(order=2)
+        # Persistent labels by key, see text()
+        self.labels = {}
+        # One sprite per board tile, built for the first board's layout and shown in tile view
+        self.tiles = []
+        self.tile_layout = None
+        self.tiles_shown = False
+        # Ten elixir bar segments, shown up to the elixir count
+        self.elixir_bars = []
+        # Hand portraits by (hand position, card name)
+        self.hand_sprites = {}
+        # Graphics for each troop drawn last frame by handle, and pools of released sprites and labels
+        self.troops = {}
+        self.free_sprites = {}
+        self.free_labels = {}
+
+        self.board = None
+        self.tile_size = tile_size
+        self.xoffset = 0.1 * 600
+        self.yoffset = 0.1 * 800
+        self.tile_view = False
+        if board is not None:
+            self.attach(board)
+
+    def attach(self, board):
+        """Render the given board from now on."""
+        self.board = board
+        for troop in self.troops.values():
+            self.release(troop)
+        self.troops = {}
+        if board.illegal_spaces is not self.tile_layout:
+            self.build_tiles()
+
+    def draw(self):
+        """Render one frame of the attached board."""
+        self.render_tiles()
+        self.render_elixir()
+        self.render_clock()
+        self.draw_troops()
+        self.render_score()
+        self.win_condition()
+        self.render_hand()
+        self.batch.draw()
+
+    def text(self, key, text, **kwargs):
+        """Show text on the persistent label key, creating it from kwargs the first time.
+
+        The label is only relaid out when text differs from what it already shows; pass '' to hide it."""
+        label = self.labels.get(key)
+        if label is None:
+            kwargs.setdefault('anchor_x', 'center')
+            kwargs.setdefault('anchor_y', 'center')
+            label = self.labels[key] = pg.text.Label(text, batch=self.batch, group=self.label_group, **kwargs)
+        elif label.text != text:
+            label.text = text
+        return label
+
+    def sprite(self, name, group=None):
+        """A new batched sprite scaled like the shared sprite for name."""
+        template = self.sprites[name]
+        sprite = pg.sprite.Sprite(template.image, batch=self.batch, group=group or self.sprite_group)
+        sprite.scale_x = template.scale_x
+        sprite.scale_y = template.scale_y
+        sprite.opacity = template.opacity
+        return sprite
+
+    def build_tiles(self):
+        """Lay out one legal or illegal tile sprite per board square for the attached board."""
+        for tile in self.tiles:
+            tile.delete()
+        self.tiles = []
+        for y in range(self.board.height):
+            for x in range(self.board.width):
+                name = 'legal' if self.board.board[y][x] >= 0 else 'illegal'
+                tile = self.sprite(name, self.tile_group)
+                tile.x, tile.y = self.xy_to_screen(x, y)
+                tile.visible = self.tiles_shown
+                self.tiles.append(tile)
+        self.tile_layout = self.board.illegal_spaces
+
+    def render_tiles(self):
+        """Render the board as legal/illegal tiles."""
+        if self.tile_view != self.tiles_shown:
+            self.tiles_shown = self.tile_view
+            for tile in self.tiles:
+                tile.visible = self.tile_view
+
+    def take_label(self, font_size, color):
+        """A troop label of this font size from the pool, or a new one."""
+        pool = self.free_labels.get(font_size)
+        if pool:
+            label = pool.pop()
+            label.color = color
+            label.visible = True
+            return label
+        return pg.text.Label('', font_name='Times New Roman', font_size=font_size, anchor_x='center',
+                             anchor_y='center', color=color, batch=self.batch, group=self.label_group)
+
+    def put_label(self, label):
+        label.visible = False
+        self.free_labels.setdefault(label.font_size, []).append(label)
+
+    def take_troop(self, card):
+        """Graphics for a newly seen troop: its card's sprite, or for towers a large health label."""
+        color = (card.is_evil*255, 0, (1-card.is_evil)*255, 255)
+        sprite = None
+        if self.grab_sprite(card.name):
+            pool = self.free_sprites.get(card.name)
+            if pool:
+                sprite = pool.pop()
+                sprite.visible = True
+            else:
+                sprite = self.sprite(card.name)
+            health_label = self.take_label(9, color)
+        else:
+            health_label = self.take_label(24, color)
+        return TroopGraphics(card.name, sprite, health_label)
+
+    def release(self, troop):
+        """Return a troop's sprite and labels to the pools."""
+        if troop.sprite is not None:
+            troop.sprite.visible = False
+            self.free_sprites.setdefault(troop.name, []).append(troop.sprite)
+        self.put_label(troop.health_label)
+        for label in troop.unit_labels:
+            self.put_label(label)
+
+    def draw_troops(self):
+        """Render all living troops and their health."""
+        drawn = {}
+        for card in self.board.registry:
+            troop = self.troops.pop(card.handle, None)
+            if troop is None:
+                troop = self.take_troop(card)
+            drawn[card.handle] = troop
+
+            if card.location != troop.location:
+                troop.location = card.location
+                # Convert location to screen space
+                screen_x, screen_y = self.xy_to_screen(card.location[0], card.location[1])
+                if troop.sprite is not None:
+                    troop.sprite.x = screen_x
+                    troop.sprite.y = screen_y
+                troop.health_label.x = screen_x
+                troop.health_label.y = screen_y + 10
+                for i, label in enumerate(troop.unit_labels):
+                    label.x = screen_x
+                    label.y = screen_y + 20 + 10*i
+            health = str(card.health)
+            if troop.health_label.text != health:
+                troop.health_label.text = health
+
+            # If multiple living units, draw all health bars
+            if troop.sprite is not None and len(troop.unit_labels) != max(card.units - 1, 0):
+                while len(troop.unit_labels) > max(card.units - 1, 0):
+                    self.put_label(troop.unit_labels.pop())
+                while len(troop.unit_labels) < card.units - 1:
+                    label = self.take_label(9, troop.health_label.color)
+                    label.text = str(card.maxhealth)
+                    label.x = troop.health_label.x
+                    label.y = troop.health_label.y + 10 + 10*len(troop.unit_labels)
+                    troop.unit_labels.append(label)
+
+        # Anything not seen this frame has left the board
+        for troop in self.troops.values():
+            self.release(troop)
+        self.troops = drawn
+
+    def grab_sprite(self, name):
+        """Convert card.name into its sprite, or None for cards without one (towers)."""
+        if name in CARD_IMAGES:
+            return self.sprites[name]
+        return None
+
+    def xy_to_screen(self, x, y):
+        """Convert board spaces into screen coordinates."""
+        new_x = x * self.tile_size + self.xoffset
+        new_y = (105 * y * self.tile_size) / 128 + self.yoffset
+        return new_x, new_y
+
+    def render_elixir(self):
+        """Elixir bar graphics."""
+        start_x = self.xoffset
+        start_y = self.yoffset / 1.5
+        if not self.elixir_bars:
+            for i in range(10):
+                bar = self.sprite('elixir')
+                bar.x = start_x + i * bar.width
+                bar.y = start_y
+                self.elixir_bars.append(bar)
+        for i, bar in enumerate(self.elixir_bars):
+            bar.visible = i < self.board.elixir_count
+
+        bar_width = self.elixir_bars[0].width
+        self.text('elixir', str(self.board.elixir_count), font_name='Times New Roman', font_size=16,
+                  x=start_x + 10 * bar_width, y=start_y)
+        self.text('full', "FULL!" if self.board.elixir_count == 10 else "", font_name='Times New Roman',
+                  font_size=16, x=start_x + 10 * bar_width, y=start_y/2)
+        self.text('evil elixir', str(self.board.evil_elixir_count), font_name='Times New Roman', font_size=16,
+                  x=start_x + 10 * bar_width, y=800 - start_y)
+
+    def render_score(self):
+        """Display crown tower score graphics."""
+        self.text('score', str(self.board.score), font_name='Times New Roman', font_size=24, x = 520, y = 350,
+                  color=(0,0,255,255))
+        self.text('evil score', str(self.board.evil_score), font_name='Times New Roman', font_size=24, x = 520,
+                  y = 450, color=(255,0,0,255))
+
+    def render_clock(self, dt = None):
+        """Clock timer graphics."""
+        minute = self.board.time // 60
+        second = str(self.board.time % 60)
+        if len(second) < 2:
+            second = "0"+second
+        self.text('clock', str(minute)+":"+second, font_name='Times New Roman', font_size=24, x = 520, y = 750)
+
+    def win_condition(self):
+        """If game has ended, trigger game ending graphics."""
+        text = ""
+        if self.board.game_over:
+            if self.board.won:
+                text = "GAME OVER: YOU WIN!"
+            else:
+                text = "GAME OVER: YOU LOSE!"
+        self.text('game over', text, font_name='Times New Roman', font_size=36, x=300, y=400)
+
+    def render_hand(self):
+        """Hand of cards graphics to show current hand and cost."""
+        shown = set()
+        for x_ind, card in enumerate(self.board.hand):
+            key = (x_ind, card.name)
+            shown.add(key)
+            sprite = self.hand_sprites.get(key)
+            if sprite is None:
+                sprite = self.hand_sprites[key] = self.sprite(card.name)
+                sprite.x = self.xoffset + (x_ind * (sprite.width + self.tile_size))
+                sprite.y = self.yoffset / 4
+            sprite.visible = True
+            # Draw cost label
+            self.text(('cost', x_ind), str(card.cost), font_name='Times New Roman', font_size=16,
+                      x=sprite.x, y=10, color=(200, 0, 200, 255))
+        for key, sprite in self.hand_sprites.items():
+            if key not in shown:
+                sprite.visible = False
+                if key[0] >= len(self.board.hand):
+                    self.text(('cost', key[0]), "")